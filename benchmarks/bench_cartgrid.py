@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2017-2021 JCT
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Main authors: JCT ~ Jonathan Teixeira (https://github.com/jontateixeira)
+#
+
+# ======================================================================
+# Scaling benchmark of utilities.CartGrid against the former list
+# comprehension implementation. Runs outside of SALOME:
+#
+#   PYTHONPATH=. python benchmarks/bench_cartgrid.py [--max-legacy-cells N]
+#
+# Note: the legacy version is only timed up to --max-legacy-cells, it
+# takes minutes (and several GB) on regional grids.
+# ======================================================================
+
+import os
+import argparse
+import time
+import numpy as np
+
+os.environ.setdefault("HYDROGEOLOGY_SALOME_DISABLE_LOGGING", "1")
+from hydrogeo_salome import utilities as utils
+
+
+def legacy_cartgrid(x, y, z):
+    """CartGrid (3D branch) as implemented before the vectorization"""
+    nodes = np.array([[i, j, k] for k in z for j in y for i in x])
+
+    nx = x.size - 1
+    ny = y.size - 1
+    nz = z.size - 1
+
+    i, j, k = np.mgrid[0:nx, 0:ny, 0:nz]
+    ijk = np.ravel_multi_index(
+        [list(i.ravel()), list(j.ravel()), list(
+            k.ravel())], (nx + 1, ny + 1, nz + 1),
+        order='F')
+    cells = np.array([[i, i+1, i+1+(nx+1), i+(nx+1),
+                       i+(nx+1)*(ny+1), i+1+(nx+1) *
+                       (ny+1), i+1+(nx+1)+(nx+1)*(ny+1),
+                       i+(nx+1)+(nx+1)*(ny+1)]
+                      for i in ijk], dtype='uint64')
+    return (nodes, cells)
+
+
+def timeit(fun, *args, **kwargs):
+    tic = time.perf_counter()
+    out = fun(*args, **kwargs)
+    return time.perf_counter() - tic, out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CartGrid scaling benchmark')
+    parser.add_argument('--max-legacy-cells', type=int, default=2_000_000)
+    parser.add_argument('--dtype', default='int32')
+    args = parser.parse_args()
+
+    sizes = [(50, 50, 10), (100, 100, 20), (200, 200, 40), (500, 500, 40)]
+    print('{:>16s} {:>12s} {:>12s} {:>12s} {:>10s}'.format(
+        'grid', 'cells', 'legacy [s]', 'new [s]', 'speedup'))
+    for nx, ny, nz in sizes:
+        x = np.linspace(0, 1, nx + 1)
+        y = np.linspace(0, 1, ny + 1)
+        z = np.linspace(0, 1, nz + 1)
+        ncells = nx * ny * nz
+
+        t_new, (nodes, cells) = timeit(utils.CartGrid, x, y, z, dtype=args.dtype)
+        if ncells <= args.max_legacy_cells:
+            t_old, (nodes_ref, cells_ref) = timeit(legacy_cartgrid, x, y, z)
+            assert np.array_equal(nodes, nodes_ref)
+            assert np.array_equal(cells, cells_ref)
+            legacy, speedup = '{:12.3f}'.format(t_old), '{:10.1f}'.format(t_old / t_new)
+        else:
+            legacy, speedup = '{:>12s}'.format('-'), '{:>10s}'.format('-')
+        print('{:>16s} {:12d} {} {:12.3f} {}'.format(
+            '{}x{}x{}'.format(nx, ny, nz), ncells, legacy, t_new, speedup))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2017-2021 JCT
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Main authors: JCT ~ Jonathan Teixeira (https://github.com/jontateixeira)
+#
+
+# ======================================================================
+# Benchmark of utilities.compact_mesh against the former renumbering of
+# the constrained grid (np.unique + float64 index map). Runs outside of
+# SALOME:
+#
+#   PYTHONPATH=. python benchmarks/bench_compact_mesh.py [--cells N]
+#
+# Note: the default grid has 10M cells, roughly 3GB of memory are
+# required by the legacy version.
+# ======================================================================
+
+import os
+import argparse
+import time
+import numpy as np
+
+os.environ.setdefault("HYDROGEOLOGY_SALOME_DISABLE_LOGGING", "1")
+from hydrogeo_salome import utilities as utils
+
+
+def legacy_compact(nodes, cells, msk):
+    """Renumbering as implemented before compact_mesh"""
+    cnodes = cells[msk]
+    vnodes = np.unique(cnodes.reshape(cnodes.size))
+    idx = np.zeros((int(vnodes.max()+1),))
+    idx[vnodes] = np.arange(0, vnodes.size)
+    vert = nodes[vnodes]
+    hexa = np.int64(np.reshape(idx[cnodes].ravel(), (cnodes.shape[0], 8)))
+    return (vert, hexa)
+
+
+def timeit(fun, *args, **kwargs):
+    tic = time.perf_counter()
+    out = fun(*args, **kwargs)
+    return time.perf_counter() - tic, out
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compact_mesh benchmark')
+    parser.add_argument('--cells', type=int, default=10_000_000)
+    parser.add_argument('--nz', type=int, default=40)
+    args = parser.parse_args()
+
+    # square footprint with a disc shaped active area (~78% of the columns)
+    n = max(1, int(round(np.sqrt(args.cells / args.nz))))
+    x = np.linspace(-1, 1, n + 1)
+    z = np.linspace(0, 1, args.nz + 1)
+    nodes, cells = utils.CartGrid(x, x, z, dtype='int32')
+    xc = 0.5 * (x[1:] + x[:-1])
+    disc = (xc[:, None]**2 + xc[None, :]**2) < 1
+    msk = np.repeat(disc.ravel(), args.nz)
+    print('grid {}x{}x{}: {} cells, {} active'.format(
+        n, n, args.nz, cells.shape[0], int(msk.sum())))
+
+    t_old, (vert_ref, hexa_ref) = timeit(legacy_compact, nodes, cells, msk)
+    t_new, (vert, hexa, _, _) = timeit(utils.compact_mesh, nodes, cells, msk)
+    assert np.array_equal(vert, vert_ref)
+    assert np.array_equal(hexa, hexa_ref)
+    print('{:>12s} {:>12s} {:>10s}'.format('legacy [s]', 'new [s]', 'speedup'))
+    print('{:12.3f} {:12.3f} {:10.1f}'.format(t_old, t_new, t_old / t_new))
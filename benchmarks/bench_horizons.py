@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2017-2021 JCT
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Main authors: JCT ~ Jonathan Teixeira (https://github.com/jontateixeira)
+#
+
+# ======================================================================
+# Benchmark of the horizon interpolation backends (horizons.METHODS) on
+# scattered picks of a synthetic surface, evaluated on a regular grid.
+# Runs outside of SALOME:
+#
+#   PYTHONPATH=. python benchmarks/bench_horizons.py [--points N]
+#
+# Note: the global (dense) rbf backend is only run up to --rbf-points
+# points, its cost grows as N^3.
+# ======================================================================
+
+import os
+import argparse
+import numpy as np
+
+os.environ.setdefault("HYDROGEOLOGY_SALOME_DISABLE_LOGGING", "1")
+from hydrogeo_salome import horizons
+
+
+def surface(x, y):
+    return 100 + 0.01 * x + 30 * np.sin(x / 2000.) * np.cos(y / 1500.)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='horizon interpolation benchmark')
+    parser.add_argument('--points', type=int, default=50_000)
+    parser.add_argument('--grid', type=int, default=300)
+    parser.add_argument('--rbf-points', type=int, default=3_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 10000, args.points)
+    y = rng.uniform(0, 8000, args.points)
+    gx, gy = np.meshgrid(np.linspace(500, 9500, args.grid),
+                         np.linspace(500, 7500, args.grid))
+    print('{} points, {} evaluated'.format(args.points, gx.size))
+
+    print('{:>10s} {:>10s} {:>10s} {:>10s} {:>12s}'.format(
+        'method', 'function', 'fit [s]', 'eval [s]', 'max error'))
+    for method, function in [('local', 'linear'), ('local', 'thin_plate'),
+                             ('delaunay', 'linear'), ('delaunay', 'cubic'),
+                             ('idw', 'linear'), ('rbf', 'linear')]:
+        if method == 'rbf' and args.points > args.rbf_points:
+            print('{:>10s} {:>10s} {:>10s}'.format(method, function, 'skipped'))
+            continue
+        h = horizons.Horizon(x, y, surface(x, y), method=method,
+                             function=function, smooth=0)
+        err = np.max(np.abs(h(gx, gy) - surface(gx, gy)))
+        print('{:>10s} {:>10s} {:10.3f} {:10.3f} {:12.3e}'.format(
+            method, function, h.fit_time, h.eval_time, err))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2017-2021 JCT
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Main authors: JCT ~ Jonathan Teixeira (https://github.com/jontateixeira)
+#
+
+# ======================================================================
+# Scaling benchmark of the parallel geometry kernels (parallel.py) over
+# 1 to N worker processes. Runs outside of SALOME:
+#
+#   PYTHONPATH=. python benchmarks/bench_parallel.py [--cells N] [--max-workers N]
+#
+# Note: times include the copy of nodes and cells to shared memory and
+# the start of the pool.
+# ======================================================================
+
+import os
+import argparse
+import time
+import numpy as np
+
+os.environ.setdefault("HYDROGEOLOGY_SALOME_DISABLE_LOGGING", "1")
+from hydrogeo_salome import utilities as utils
+from hydrogeo_salome import parallel
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='parallel kernels benchmark')
+    parser.add_argument('--cells', type=int, default=4_000_000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    n = max(1, int(round(args.cells ** (1. / 3))))
+    axis = np.linspace(0, 1, n + 1)
+    nodes, cells = utils.CartGrid(axis, axis, axis, dtype='int64')
+    rng = np.random.default_rng(0)
+    nodes += rng.normal(0, 0.1 / n, nodes.shape)
+    print('grid {0}x{0}x{0}: {1} cells, {2} cpus'.format(
+        n, cells.shape[0], os.cpu_count()))
+
+    kernels = sorted(parallel.KERNELS)
+    print('{:>8s}'.format('workers') + ''.join(
+        '{:>16s}'.format(k + ' [s]') for k in kernels))
+    reference = {}
+    for workers in range(1, args.max_workers + 1):
+        line = '{:8d}'.format(workers)
+        for kernel in kernels:
+            tic = time.perf_counter()
+            out = parallel.run_cell_kernel(kernel, nodes, cells, workers)
+            line += '{:16.3f}'.format(time.perf_counter() - tic)
+            if workers == 1:
+                reference[kernel] = out
+            else:
+                assert all(np.array_equal(out[k], reference[kernel][k]) for k in out)
+        print(line)
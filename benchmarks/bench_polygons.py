@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2017-2021 JCT
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Main authors: JCT ~ Jonathan Teixeira (https://github.com/jontateixeira)
+#
+
+
+# ======================================================================
+# Benchmark of the indexed point in polygon test (see polygons.Polygon)
+# against matplotlib.path.Path.contains_points, on an outline with many
+# vertices, a hole and a second part. Runs outside of SALOME:
+#
+#   PYTHONPATH=. python benchmarks/bench_polygons.py [--vertices N] [--points N]
+#
+# Note: matplotlib tests every point against every edge, keep --points
+# small for the reference run (--skip-reference to time the engine only).
+# ======================================================================
+
+import os
+import argparse
+import time
+import numpy as np
+
+os.environ.setdefault("HYDROGEOLOGY_SALOME_DISABLE_LOGGING", "1")
+from hydrogeo_salome import polygons
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='point in polygon benchmark')
+    parser.add_argument('--vertices', type=int, default=100_000)
+    parser.add_argument('--points', type=int, default=100_000)
+    parser.add_argument('--skip-reference', action='store_true')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    t = np.linspace(0, 2 * np.pi, args.vertices, endpoint=False)
+    r = 1000 + 100 * np.sin(37 * t) + rng.standard_normal(t.size).cumsum() / 6
+    outer = np.c_[r * np.cos(t), r * np.sin(t)]
+    hole = 0.3 * outer[::-100]
+    part = np.array([[2000., 0.], [2500., 0.], [2500., 500.], [2000., 500.]])
+    points = rng.uniform(-1500, 2600, (args.points, 2))
+
+    tic = time.perf_counter()
+    polygon = polygons.Polygon([outer, hole, part])
+    build = time.perf_counter() - tic
+    tic = time.perf_counter()
+    inside = polygon.contains(points)
+    query = time.perf_counter() - tic
+    print('{} edges in {} bands, {} points ({} inside)'.format(
+        polygon.n_edges, polygon.n_bands, points.shape[0], inside.sum()))
+    print('{:>12s} {:>10s} {:>10s}'.format('', 'build [s]', 'query [s]'))
+    print('{:>12s} {:10.3f} {:10.3f}'.format('polygons', build, query))
+
+    if not args.skip_reference:
+        from matplotlib import path
+        tic = time.perf_counter()
+        reference = np.zeros((points.shape[0],), dtype=bool)
+        for ring in (outer, hole, part):
+            reference ^= path.Path(ring).contains_points(points)
+        elapsed = time.perf_counter() - tic
+        assert np.array_equal(inside, reference)
+        print('{:>12s} {:>10s} {:10.3f}'.format('matplotlib', '-', elapsed))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2017-2021 JCT
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Main authors: JCT ~ Jonathan Teixeira (https://github.com/jontateixeira)
+#
+
+# ======================================================================
+# Scaling benchmark of the tiled evaluation of horizons (see
+# parallel.evaluate_surface) over 1 to N worker processes, with a local
+# RBF horizon fitted on scattered picks. Runs outside of SALOME:
+#
+#   PYTHONPATH=. python benchmarks/bench_surface.py [--columns N] [--max-workers N]
+#
+# Note: times include the copy of the points to shared memory, the start
+# of the pool and the transfer of the fitted horizon to every worker.
+# ======================================================================
+
+import os
+import argparse
+import time
+import numpy as np
+
+os.environ.setdefault("HYDROGEOLOGY_SALOME_DISABLE_LOGGING", "1")
+from hydrogeo_salome import horizons
+from hydrogeo_salome import parallel
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='tiled surface evaluation benchmark')
+    parser.add_argument('--columns', type=int, default=1_000_000)
+    parser.add_argument('--points', type=int, default=50_000)
+    parser.add_argument('--method', default='local', choices=horizons.METHODS)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 10000, args.points)
+    y = rng.uniform(0, 8000, args.points)
+    z = 100 + 0.01 * x + 30 * np.sin(x / 2000.) * np.cos(y / 1500.)
+    horizon = horizons.Horizon(x, y, z, method=args.method)
+
+    n = max(1, int(round(np.sqrt(args.columns))))
+    gx, gy = np.meshgrid(np.linspace(0, 10000, n), np.linspace(0, 8000, n))
+    print('{} picks, {} columns, {} cpus'.format(args.points, gx.size,
+                                                  os.cpu_count()))
+
+    print('{:>8s} {:>10s} {:>10s} {:>12s}'.format(
+        'workers', 'time [s]', 'speedup', 'efficiency'))
+    workers = 1
+    while workers <= args.max_workers:
+        tic = time.perf_counter()
+        out = parallel.evaluate_surface(horizon, gx, gy, workers)
+        elapsed = time.perf_counter() - tic
+        if workers == 1:
+            reference, serial = out, elapsed
+        else:
+            assert np.array_equal(out, reference)
+        print('{:8d} {:10.3f} {:10.2f} {:12.2f}'.format(
+            workers, elapsed, serial / elapsed, serial / elapsed / workers))
+        workers *= 2
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2017-2021 JCT
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Main authors: JCT ~ Jonathan Teixeira (https://github.com/jontateixeira)
+#
+
+# ======================================================================
+# Benchmark of utilities.volume_hexahedra (batched) against the scalar
+# utilities.volume_hexahedron on a randomly perturbed grid. Runs outside
+# of SALOME:
+#
+#   PYTHONPATH=. python benchmarks/bench_volume.py [--cells N]
+#
+# Note: the scalar routine is only timed on --scalar-cells cells and its
+# time is extrapolated to the whole grid.
+# ======================================================================
+
+import os
+import argparse
+import time
+import numpy as np
+
+os.environ.setdefault("HYDROGEOLOGY_SALOME_DISABLE_LOGGING", "1")
+from hydrogeo_salome import utilities as utils
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='hexahedron volume benchmark')
+    parser.add_argument('--cells', type=int, default=1_000_000)
+    parser.add_argument('--scalar-cells', type=int, default=20_000)
+    args = parser.parse_args()
+
+    n = max(1, int(round(args.cells ** (1. / 3))))
+    axis = np.linspace(0, 1, n + 1)
+    nodes, cells = utils.CartGrid(axis, axis, axis, dtype='int64')
+    rng = np.random.default_rng(0)
+    nodes += rng.normal(0, 0.1 / n, nodes.shape)
+    coords = nodes[cells]
+    print('grid {0}x{0}x{0}: {1} cells'.format(n, cells.shape[0]))
+
+    tic = time.perf_counter()
+    _, volumes = utils.volume_hexahedra(coords)
+    t_new = time.perf_counter() - tic
+
+    m = min(args.scalar_cells, cells.shape[0])
+    tic = time.perf_counter()
+    ref = np.array([utils.volume_hexahedron(c) for c in coords[:m]])
+    t_old = (time.perf_counter() - tic) * cells.shape[0] / m
+
+    err = np.max(np.abs(volumes[:m] - ref) / np.abs(ref))
+    print('{:>12s} {:>12s} {:>10s} {:>14s}'.format(
+        'scalar [s]', 'batched [s]', 'speedup', 'max rel. diff'))
+    print('{:12.3f} {:12.3f} {:10.1f} {:14.3e}'.format(
+        t_old, t_new, t_old / t_new, err))
@@ -34,6 +34,8 @@ import os
 import shapefile # pyshp
 import numpy as np
 
+from . import polygons
+
 import logging
 LOG = logging.getLogger(__name__)
 
@@ -254,7 +256,7 @@ class BoundaryConditionDialog(QtWGui.QDialog):
                     shp = sf.shapes()
                     d = []
                     for s in shp:
-                        d.append(np.asarray(s.points))
+                        d.append(polygons.Polygon(polygons.shape_rings(s)))
                 elif fullpath[-4:].lower() == '.csv':
                     # Get region limits (xy data)
                     d = [np.loadtxt(fullpath.strip(), skiprows=1, delimiter=',', usecols=[1, 2])]
@@ -31,9 +31,9 @@ except ImportError:
     from PyQt5 import QtCore
 
 import os
-import shapefile # pyshp
-import numpy as np
-import scipy.interpolate as inter
+
+from . import horizons
+from . import polygons
 
 import logging
 LOG = logging.getLogger(__name__)
@@ -276,6 +276,14 @@ class GridModelWithConstraintDialog(GridModelDialog):
         self._interpFun.setObjectName("interpolation")
         self._vbox1.addWidget(self._interpFun)
 
+        self._interpMethod = QtWGui.QLabel(self)
+        self._interpMethod.setObjectName("interpolationMethod")
+        self._vbox1.addWidget(self._interpMethod)
+
+        self._rasterSize = QtWGui.QLabel(self)
+        self._rasterSize.setObjectName("rasterSize")
+        self._vbox1.addWidget(self._rasterSize)
+
         self._hbox1.addLayout(self._vbox1)
         self._hbox1.addLayout(self._vbox1)
 
@@ -313,6 +321,15 @@ class GridModelWithConstraintDialog(GridModelDialog):
         self._txtInterp.setObjectName("txtInterpolation")
         self._vbox2.addWidget(self._txtInterp)
 
+        self._cbInterpMethod = QtWGui.QComboBox(self)
+        self._cbInterpMethod.setObjectName("cbInterpolationMethod")
+        self._cbInterpMethod.addItems(list(horizons.METHODS))
+        self._vbox2.addWidget(self._cbInterpMethod)
+
+        self._txtRasterSize = QtWGui.QLineEdit(self)
+        self._txtRasterSize.setObjectName("txtRasterSize")
+        self._vbox2.addWidget(self._txtRasterSize)
+
         self._hbox1.addLayout(self._vbox2)
         self._vbox.addLayout(self._hbox1)
         
@@ -337,14 +354,18 @@ class GridModelWithConstraintDialog(GridModelDialog):
         self._topHoriz.setText("top horizon")
         self._botHoriz.setText("bottom horizon")
         self._interpFun.setText("Interpolation method")
+        self._interpMethod.setText("Interpolation backend")
+        self._rasterSize.setText("Horizon raster cell size")
         
         self._txtNx.setToolTip('Number of cell blocks in x-direction')
         self._txtNy.setToolTip('Number of cell blocks in y-direction')
         self._txtNz.setToolTip('Number of cell blocks in z-direction')
         self._txtconstraints.setToolTip('Full path of model constraints/limits (shapefile format)')
-        self._txtTopHorizon.setToolTip('Full path of top horizon file (ID xyz format)')
-        self._txtBotHorizon.setToolTip('Full path of Bottom horizon file (ID xyz format)')
+        self._txtTopHorizon.setToolTip('Full path of top horizon file (ID xyz format, or .asc/.flt raster used without fit)')
+        self._txtBotHorizon.setToolTip('Full path of Bottom horizon file (ID xyz format, or .asc/.flt raster used without fit)')
         self._txtInterp.setToolTip('Interpolation method: multiquadric, inverse, gaussian,[linear], cubic, quintic')
+        self._txtRasterSize.setToolTip('Cell size of the raster where horizons are sampled once and then interpolated bilinearly (0 evaluates the interpolation at every vertex)')
+        self._cbInterpMethod.setToolTip('Interpolation backend: [local] (nearest points RBF), rbf (global, small data sets), delaunay (linear or cubic), idw')
 
         self.handleAcceptWith(self.accept)
         self.handleRejectWith(self.reject)
@@ -361,6 +382,8 @@ class GridModelWithConstraintDialog(GridModelDialog):
         self._txtBotHorizon.setText("ID+xyz delimited format")
         self._txtTopHorizon.setText("ID+xyz delimited format")
         self._txtInterp.setText("linear")
+        self._cbInterpMethod.setCurrentIndex(0)
+        self._txtRasterSize.setText("0")
     
 
     def getConstraintArea(self):
@@ -373,58 +396,58 @@ class GridModelWithConstraintDialog(GridModelDialog):
             return None
         else:
             try:
-                # Open shapefile
-                sf = shapefile.Reader(fullpath)
-
-                # Get points ~ has only one shape!!
-                shp = sf.shapes()[0]
-
-                # # Collect points
-                pts = np.asarray(shp.points)
-                return pts
+                # all shapes, with their parts and holes
+                return polygons.read_shapefile(fullpath)
             except:
                 return None
     
 
-    def getTopHorizon(self):
-        fullpath = self._txtTopHorizon.text()
+    def getInterpolation(self):
+        """interpolation (backend, function) of the horizons, see horizons.py"""
+        return self._cbInterpMethod.currentText(), self._txtInterp.text()
+
+
+    def getRasterSize(self):
+        """cell size of the horizons raster (0: no raster)"""
+        try:
+            return max(float(self._txtRasterSize.text()), 0.0)
+        except ValueError:
+            return 0.0
+
+
+    def _loadHorizon(self, fullpath):
         if not (os.path.exists(fullpath)):
             return None
         else:
             try:
-                # Get top horizon data
-                d = np.loadtxt(fullpath, skiprows=1, usecols=[1, 2, 3])
-
-                # Get points ~ has only one shape!!
-                xt = d[:, 0]
-                xx = [np.min(xt), np.max(xt)]
-                yt = d[:, 1]
-                yy = [np.min(yt), np.max(yt)]
-                zt = d[:, 2]
-
-                # interpolate verticies
-                return inter.Rbf(xt, yt, zt, function=self._txtInterp.text(), smooth=100)
-            except:
+                # rasters are memory mapped, nothing to fit
+                if horizons.is_raster(fullpath):
+                    return horizons.read_raster(fullpath)
+
+                # points thinned on bins of half the model cells
+                method, function = self.getInterpolation()
+                limits = self.getConstraintArea()
+                bbox = bin_size = None
+                if limits is not None:
+                    nx, ny, _ = self.getNumberOfBlock()
+                    bbox = limits.bbox
+                    bin_size = 0.5 * (bbox[2:] - bbox[:2]) / [nx, ny]
+
+                # interpolate verticies (sampled on a raster over the model area)
+                raster_size = self.getRasterSize() if bbox is not None else 0
+                return horizons.load_horizon(fullpath, method=method,
+                                             function=function, smooth=100,
+                                             bin_size=bin_size,
+                                             max_points=horizons.MAX_FIT_POINTS,
+                                             raster_size=raster_size, bbox=bbox)
+            except Exception:
+                LOG.exception('Failed to interpolate horizon %s', fullpath)
                 return None
-    
+
+
+    def getTopHorizon(self):
+        return self._loadHorizon(self._txtTopHorizon.text())
+
 
     def getBottomHorizon(self):
-        fullpath = self._txtBotHorizon.text()
-        if not (os.path.exists(fullpath)):
-            return None
-        else:
-            try:
-                # Get bottom horizon data
-                d = np.loadtxt(fullpath, skiprows=1, usecols=[1, 2, 3])
-
-                # Get points ~ has only one shape!!
-                xb = d[:, 0]
-                xx = [np.min(xb), np.max(xb)]
-                yb = d[:, 1]
-                yy = [np.min(yb), np.max(yb)]
-                zb = d[:, 2]
-
-                # interpolate verticies
-                return inter.Rbf(xb, yb, zb, function=self._txtInterp.text(), smooth=100)
-            except:
-                return None
\ No newline at end of file
+        return self._loadHorizon(self._txtBotHorizon.text())
@@ -0,0 +1,236 @@
+# Copyright (C) 2017-2020 JCT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author : Jonathan Teixeira (jonathan.teixeira@ufpe.br)
+#
+
+
+"""
+This file contains the geometry (centroids, volumes, faces) of hexahedral
+meshes computed in batch (no Salome dependencies)
+"""
+
+# plugin imports
+from . import parallel
+from . import spatial
+
+# python imports
+import numpy as np
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# Local CONST.
+# hexahedron faces with outward normals (corners ordered as in CartGrid), the
+# same faces of macros.SmeshFromNodesAndCellNodes: bottom, y-, x+, y+, x-, top
+HEXA_FACES = np.array([[0, 3, 2, 1], [0, 1, 5, 4], [1, 2, 6, 5],
+                       [2, 3, 7, 6], [3, 0, 4, 7], [4, 5, 6, 7]])
+# sides of the model: name, axis and direction of the outward normal
+SIDES = (('Westside', 0, -1), ('Eastside', 0, +1),
+         ('Southside', 1, -1), ('Northside', 1, +1),
+         ('Bottomside', 2, -1), ('Topside', 2, +1))
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+
+class GridGeometry(object):
+    """
+    Geometry of a hexahedral mesh (nodes, cells) computed in batch for all the
+    cells and cached: centroids, volumes, face centroids, face areas and
+    outward normals, boundary faces and spatial indexes. Assigning nodes (or
+    calling invalidate after changing them in place) clears the cache. Centroids, volumes and
+    quality run in parallel with more than one worker (see parallel.py).
+    """
+
+    def __init__(self, nodes, cells, workers=None):
+        self._cache = {}
+        self.nodes = nodes
+        self.cells = cells
+        self.workers = workers
+
+    @property
+    def nodes(self):
+        """node coordinates (n_nodes, 3)"""
+        return self._nodes
+
+    @nodes.setter
+    def nodes(self, nodes):
+        self._nodes = np.asarray(nodes, dtype=np.float64)
+        self.invalidate()
+
+    @property
+    def cells(self):
+        """cells connectivities (n_cells, 8), 0-based"""
+        return self._cells
+
+    @cells.setter
+    def cells(self, cells):
+        self._cells = np.asarray(cells)
+        self.invalidate()
+
+    def invalidate(self):
+        """drop the cached quantities (e.g. after changing nodes in place)"""
+        self._cache.clear()
+
+    def _cached(self, key, fun):
+        if key not in self._cache:
+            self._cache[key] = fun()
+        return self._cache[key]
+
+    @property
+    def n_cells(self):
+        return self._cells.shape[0]
+
+    # --------------------------------------------------------------------------
+    # cells
+    def coords(self, ids=None):
+        """corner coordinates (n, 8, 3) of the given cells (all if None)"""
+        cells = self._cells if ids is None else self._cells[ids]
+        return self._nodes[cells]
+
+    @property
+    def centroids(self):
+        """cell centroids (n_cells, 3), mean of the 8 corners"""
+        return self._cached('centroids', lambda: parallel.cell_centroids(
+            self._nodes, self._cells, self.workers))
+
+    @property
+    def volumes(self):
+        """cell volumes (n_cells,), 2x2x2 Gauss integration of the trilinear
+        map (as utilities.volume_hexahedron)"""
+        return self._cached('volumes', lambda: parallel.cell_volumes(
+            self._nodes, self._cells, self.workers))
+
+    @property
+    def quality(self):
+        """cell quality metrics, see quality.cell_quality"""
+        return self._cached('quality', lambda: parallel.cell_quality(
+            self._nodes, self._cells, self.workers))
+
+    # --------------------------------------------------------------------------
+    # spatial indexes (see spatial.SpatialIndex)
+    @property
+    def node_index(self):
+        """spatial index of the nodes"""
+        return self._cached('node_index', lambda: spatial.SpatialIndex(
+            self._nodes))
+
+    @property
+    def centroid_index(self):
+        """spatial index of the cell centroids"""
+        return self._cached('centroid_index', lambda: spatial.SpatialIndex(
+            self.centroids))
+
+    @property
+    def boundary_index(self):
+        """spatial index of the (x, y) centroids of the boundary faces, ordered
+        as boundary_faces"""
+        def fun():
+            c, f = self.boundary_faces
+            return spatial.SpatialIndex(self.face_centroids[c, f, :2])
+        return self._cached('boundary_index', fun)
+
+    # --------------------------------------------------------------------------
+    # faces (n_cells, 6, ...) ordered as HEXA_FACES
+    @property
+    def face_nodes(self):
+        """nodes (n_cells, 6, 4) of the cell faces"""
+        return self._cached('face_nodes', lambda: self._cells[:, HEXA_FACES])
+
+    @property
+    def face_centroids(self):
+        """face centroids (n_cells, 6, 3), mean of the 4 corners"""
+        return self._cached('face_centroids', lambda: np.mean(
+            self._nodes[self.face_nodes], axis=2))
+
+    @property
+    def face_vectors(self):
+        """outward area vectors (n_cells, 6, 3), half the cross product of the
+        diagonals (exact for non-planar bilinear faces)"""
+        def fun():
+            p = self._nodes[self.face_nodes]
+            return 0.5 * np.cross(p[:, :, 2] - p[:, :, 0], p[:, :, 3] - p[:, :, 1])
+        return self._cached('face_vectors', fun)
+
+    @property
+    def face_areas(self):
+        """face areas (n_cells, 6), norm of the area vectors"""
+        return self._cached('face_areas', lambda: np.linalg.norm(
+            self.face_vectors, axis=2))
+
+    @property
+    def face_normals(self):
+        """outward unit normals (n_cells, 6, 3), zero for collapsed faces"""
+        def fun():
+            area = self.face_areas[:, :, None]
+            return np.divide(self.face_vectors, area,
+                             out=np.zeros(self.face_vectors.shape), where=area > 0)
+        return self._cached('face_normals', fun)
+
+    # --------------------------------------------------------------------------
+    # boundary
+    @property
+    def boundary_faces(self):
+        """(cell ids, local face ids) of the faces not shared by two cells"""
+        def fun():
+            keys = np.sort(self.face_nodes.reshape((-1, 4)), axis=1)
+            order = np.lexsort(keys.T[::-1])
+            keys = keys[order]
+            same = np.all(keys[1:] == keys[:-1], axis=1)
+            single = np.ones((keys.shape[0],), dtype=bool)
+            single[1:] &= ~same
+            single[:-1] &= ~same
+            faces = np.sort(order[single])
+            return faces // 6, faces % 6
+        return self._cached('boundary_faces', fun)
+
+    def boundary_sides(self, bbox=None):
+        """masks of the boundary faces (see boundary_faces) on each side of the
+        model, see boundary_sides (bbox defaults to the bounding box of the
+        nodes)"""
+        if bbox is None:
+            bbox = np.concatenate((self._nodes.min(axis=0), self._nodes.max(axis=0)))
+        c, f = self.boundary_faces
+        return boundary_sides(self.face_centroids[c, f], self.face_normals[c, f],
+                              bbox)
+
+
+# ------------------------------------------------------------------------------
+def boundary_sides(centroids, normals, bbox=None):
+    """
+    Classify boundary faces on the sides of the model (West, East, South,
+    North, Bottom and Top, see SIDES) given their centroids and normals.
+    Faces with the centroid on the bounding box (minX, ..., maxZ) of the
+    centroids, or, if there are none, faces whose normal points mainly along
+    the side direction. Returns a list of (side name, mask of faces).
+    """
+    centroids = np.asarray(centroids, dtype=np.float64)
+    normals = np.asarray(normals, dtype=np.float64)
+    if bbox is None:
+        bbox = np.concatenate((centroids.min(axis=0), centroids.max(axis=0)))
+    main = np.argmax(np.abs(normals), axis=1)
+    sides = []
+    for name, axis, direction in SIDES:
+        limit = bbox[axis] if direction < 0 else bbox[axis + 3]
+        mask = centroids[:, axis] == limit
+        if not np.any(mask):
+            mask = (normals[:, axis] * direction > 0) & (main == axis)
+        sides.append((name, mask))
+    return sides
@@ -0,0 +1,647 @@
+# Copyright (C) 2017-2020 JCT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author : Jonathan Teixeira (jonathan.teixeira@ufpe.br)
+#
+
+"""
+This file contains grid data structures (no Salome dependencies)
+"""
+
+# plugin imports
+from . import utilities as utils
+
+# python imports
+import numpy as np
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# Local CONST.
+# local (i, j, k) offsets of the hexahedron nodes, same ordering of CartGrid
+HEXA_CORNERS = np.array([[0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+                         [0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]])
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+
+class StructuredGrid(object):
+    """
+    Cartesian grid described only by its axes (x, y, z) and an optional mask of
+    active cells. Node coordinates, connectivities, centroids and ijk indexes
+    are computed on demand, for all entities or for a block of ids, so memory
+    stays O(nx + ny + nz) until a consumer asks for an array.
+
+    Numbering is the same of utilities.CartGrid: nodes with x running fastest
+    (then y and z) and cells with k running fastest (then j and i).
+    """
+
+    def __init__(self, x, y, z, active=None, dtype='int64'):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.z = np.asarray(z, dtype=np.float64)
+        self.dtype = np.dtype(dtype)
+        utils._check_index_dtype(self.n_nodes, self.dtype)
+        self.active = active
+
+    # --------------------------------------------------------------------------
+    # sizes
+    @property
+    def shape(self):
+        """number of cells along each axis (nx, ny, nz)"""
+        return (self.x.size - 1, self.y.size - 1, self.z.size - 1)
+
+    @property
+    def node_shape(self):
+        """number of nodes along each axis (nx + 1, ny + 1, nz + 1)"""
+        return (self.x.size, self.y.size, self.z.size)
+
+    @property
+    def n_nodes(self):
+        return self.x.size * self.y.size * self.z.size
+
+    @property
+    def n_cells(self):
+        nx, ny, nz = self.shape
+        return nx * ny * nz
+
+    @property
+    def n_active(self):
+        if self._active is None:
+            return self.n_cells
+        n = int(np.count_nonzero(self._active))
+        return n * self.shape[2] if self._active.shape[2] == 1 else n
+
+    # --------------------------------------------------------------------------
+    # active cells
+    @property
+    def active(self):
+        """boolean mask of active cells, shape (nx, ny, 1) when the mask is
+        given by columns or (nx, ny, nz) otherwise (None: all cells active)"""
+        return self._active
+
+    @active.setter
+    def active(self, mask):
+        self._rank = None
+        if mask is None:
+            self._active = None
+            return
+        nx, ny, nz = self.shape
+        mask = np.asarray(mask, dtype=bool)
+        if mask.size == nx * ny and mask.shape != (nx, ny, nz):
+            mask = mask.reshape((nx, ny, 1))
+        elif mask.size == nx * ny * nz:
+            mask = mask.reshape((nx, ny, nz))
+        else:
+            raise ValueError('mask of active cells must have (nx, ny) or '
+                             '(nx, ny, nz) entries, got {}'.format(mask.shape))
+        self._active = mask
+
+    def active_cells(self):
+        """ids of the active cells"""
+        if self._active is None:
+            return np.arange(self.n_cells, dtype=self.dtype)
+        mask = np.broadcast_to(self._active, self.shape)
+        return np.flatnonzero(mask).astype(self.dtype, copy=False)
+
+    # --------------------------------------------------------------------------
+    # index conversion
+    def cell_id(self, i, j, k):
+        """cell ids from (i, j, k) indexes"""
+        nx, ny, nz = self.shape
+        return np.ravel_multi_index((i, j, k), (nx, ny, nz)).astype(self.dtype)
+
+    def cell_ijk(self, ids):
+        """(i, j, k) indexes of cell ids"""
+        return np.unravel_index(np.asarray(ids, dtype=np.int64), self.shape)
+
+    def node_id(self, i, j, k):
+        """node ids from (i, j, k) indexes"""
+        return np.ravel_multi_index((i, j, k), self.node_shape,
+                                    order='F').astype(self.dtype)
+
+    def node_ijk(self, ids):
+        """(i, j, k) indexes of node ids"""
+        return np.unravel_index(np.asarray(ids, dtype=np.int64),
+                                self.node_shape, order='F')
+
+    # --------------------------------------------------------------------------
+    # geometry and topology
+    def node_coords(self, ids=None):
+        """node coordinates (n, 3) of the given ids (all nodes if None)"""
+        if ids is None:
+            return self._all_node_coords()
+        i, j, k = self.node_ijk(ids)
+        return np.column_stack((self.x[i], self.y[j], self.z[k]))
+
+    def _all_node_coords(self):
+        nodes = np.empty((self.n_nodes, 3))
+        nodes[:, 0] = np.tile(self.x, self.y.size * self.z.size)
+        nodes[:, 1] = np.tile(np.repeat(self.y, self.x.size), self.z.size)
+        nodes[:, 2] = np.repeat(self.z, self.x.size * self.y.size)
+        return nodes
+
+    def cell_nodes(self, ids=None):
+        """connectivities (n, 8) of the given cell ids (all cells if None)"""
+        if ids is None:
+            ids = np.arange(self.n_cells, dtype=self.dtype)
+        i, j, k = self.cell_ijk(ids)
+        sx, sy = self.x.size, self.x.size * self.y.size
+        base = (i + j * sx + k * sy).astype(self.dtype)
+        offsets = (HEXA_CORNERS[:, 0] + HEXA_CORNERS[:, 1] * sx +
+                   HEXA_CORNERS[:, 2] * sy).astype(self.dtype)
+        return base[:, None] + offsets[None, :]
+
+    def cell_centroids(self, ids=None, chunk_size=1 << 20):
+        """centroids (n, 3) of the given cell ids (all cells if None), taken as
+        the mean of the 8 cell nodes (gathered from the per-axis centres, see
+        axis_centroids, in blocks of chunk_size cells)"""
+        if ids is None:
+            ids = np.arange(self.n_cells, dtype=self.dtype)
+        centres = [self._axis_centres(d) for d in range(3)]
+        centroids = np.empty((np.size(ids), 3))
+        for c in range(0, centroids.shape[0], chunk_size):
+            ijk = self.cell_ijk(ids[c:c + chunk_size])
+            for d in range(3):
+                centroids[c:c + chunk_size, d] = centres[d][ijk[d]]
+        return centroids
+
+    def column_centroids(self, rows=None):
+        """(x, y) centroids of the cell columns, shape (nx, ny, 2), computed
+        the same way of cell_centroids. rows=(j0, j1) restricts the columns
+        to the j-rows j0 <= j < j1"""
+        nx, ny, _ = self.shape
+        j0, j1 = (0, ny) if rows is None else rows
+        xc, yc = self.axis_centroids()
+        centroids = np.empty((nx, j1 - j0, 2))
+        centroids[:, :, 0] = xc[:, None]
+        centroids[:, :, 1] = yc[None, j0:j1]
+        return centroids
+
+    def axis_centroids(self):
+        """x centroids of the cells along i and y centroids along j, computed
+        the same way of cell_centroids (a column centroid is (xc[i], yc[j]))"""
+        return self._axis_centres(0), self._axis_centres(1)
+
+    def _axis_centres(self, d):
+        """coordinate d of the cell centroids along that axis, mean of the 8
+        cell nodes"""
+        axis = (self.x, self.y, self.z)[d]
+        idx = np.arange(axis.size - 1)
+        corners = axis[idx[None] + HEXA_CORNERS[:, d][:, None]]
+        return np.mean(corners, axis=0)
+
+    def iter_cells(self, chunk_size=1 << 20, active_only=True):
+        """yields (ids, connectivities) of blocks with up to chunk_size cells"""
+        if active_only and self._active is not None:
+            ids = self.active_cells()
+            for c in range(0, ids.size, chunk_size):
+                block = ids[c:c + chunk_size]
+                yield block, self.cell_nodes(block)
+        else:
+            for c in range(0, self.n_cells, chunk_size):
+                block = np.arange(c, min(c + chunk_size, self.n_cells),
+                                  dtype=self.dtype)
+                yield block, self.cell_nodes(block)
+
+    def to_arrays(self, scratch_dir=None, name=None):
+        """materialize the whole grid, same output of utilities.CartGrid"""
+        return utils.CartGrid(self.x, self.y, self.z, dtype=self.dtype,
+                              scratch_dir=scratch_dir, name=name)
+
+    # --------------------------------------------------------------------------
+    # slab by slab (out-of-core) access of a grid clipped by columns. Nodes
+    # are numbered after removing the ones out of the active columns, with the
+    # same ordering of the in-memory flow: id = k * n_nodes_2d + rank(i, j)
+    def clip_columns(self, limits, max_bytes=None):
+        """set as active the columns whose centroid is inside the polygon
+        limits (ndarray (n, 2) or polygons.Polygon with parts and holes). The
+        footprint is the same for every layer, so the test runs once per
+        column (see utilities.scanline_mask)"""
+        xc, yc = self.axis_centroids()
+        mask = utils.scanline_mask(xc, yc, limits, max_bytes)
+        self.active = mask
+        return mask
+
+    def _columns(self):
+        """mask (nx, ny) of active columns"""
+        nx, ny, _ = self.shape
+        if self._active is None:
+            return np.ones((nx, ny), dtype=bool)
+        if self._active.shape[2] != 1:
+            raise ValueError('slab access needs the active cells given by columns')
+        return self._active[:, :, 0]
+
+    def _node_rank(self):
+        """(nx + 1, ny + 1) rank of the nodes of the active columns in a
+        layer (-1 for unused nodes) and the number of these nodes"""
+        if self._rank is None:
+            cols = self._columns()
+            used = np.zeros(self.node_shape[:2], dtype=bool)
+            used[:-1, :-1] |= cols
+            used[1:, :-1] |= cols
+            used[1:, 1:] |= cols
+            used[:-1, 1:] |= cols
+            rank = np.full(used.shape, -1, dtype=np.int64)
+            # x running fastest, then y
+            rank.T[used.T] = np.arange(np.count_nonzero(used))
+            self._rank = rank
+        return self._rank, int(np.count_nonzero(self._rank >= 0))
+
+    def n_slab_nodes(self):
+        """number of nodes of the grid clipped by columns"""
+        return self._node_rank()[1] * self.z.size
+
+    def iter_slabs(self, axis='k', max_bytes=None):
+        """yields (start, stop) ranges of k-layers (axis='k') or j-rows
+        (axis='j') of cells whose nodes and cells fit in max_bytes"""
+        nx, ny, nz = self.shape
+        n2d = self._node_rank()[1]
+        ncols = int(np.count_nonzero(self._columns()))
+        # coordinates + ids per node, connectivities per cell
+        if axis == 'k':
+            n, per_slice = nz, n2d * 32 + ncols * 64
+        elif axis == 'j':
+            n, per_slice = ny, (nx + 1) * (nz + 1) * 32 + nx * nz * 64
+        else:
+            raise ValueError('slab axis must be "k" or "j", got {}'.format(axis))
+        step = max(1, utils.GetMemoryBudget(max_bytes) // max(1, per_slice))
+        for start in range(0, n, step):
+            yield start, min(start + step, n)
+
+    def sample_horizons(self, fun_top, fun_base, chunk_size=1 << 16):
+        """evaluate top and base horizons (functions of x, y) at the nodes of a
+        layer of the active columns, in the order of the node ranks"""
+        rank, n2d = self._node_rank()
+        j, i = np.nonzero(rank.T >= 0)
+        top = np.empty((n2d,))
+        base = np.empty((n2d,))
+        for c in range(0, n2d, chunk_size):
+            xc, yc = self.x[i[c:c + chunk_size]], self.y[j[c:c + chunk_size]]
+            top[c:c + chunk_size] = fun_top(xc, yc)
+            base[c:c + chunk_size] = fun_base(xc, yc)
+        return top, base
+
+    def slab_nodes(self, axis, start, stop, top=None, base=None):
+        """returns (ids, coordinates) of the nodes owned by a slab, i.e. the
+        levels (or rows) start <= k < stop, plus the last one for the last
+        slab. With top and base (see sample_horizons), z is linearly spaced
+        between the horizons (see column_levels)"""
+        rank, n2d = self._node_rank()
+        j, i = np.nonzero(rank.T >= 0)
+        nz = self.shape[2]
+        if axis == 'k':
+            levels = np.arange(start, stop + (stop == nz))
+            r0, r1 = 0, n2d
+        else:
+            levels = np.arange(nz + 1)
+            last = stop + (stop == self.shape[1])
+            r0, r1 = np.searchsorted(j, [start, last])
+        cols = np.arange(r0, r1)
+        ids = (levels[:, None] * n2d + cols[None, :]).ravel()
+
+        nodes = np.empty((ids.size, 3))
+        nodes[:, 0] = np.tile(self.x[i[r0:r1]], levels.size)
+        nodes[:, 1] = np.tile(self.y[j[r0:r1]], levels.size)
+        if top is None or base is None:
+            nodes[:, 2] = np.repeat(self.z[levels], cols.size)
+        else:
+            nodes[:, 2] = column_levels(base[r0:r1], top[r0:r1], levels, nz).ravel()
+        return ids, nodes
+
+    def slab_cells(self, axis, start, stop):
+        """connectivities (compacted ids, see slab_nodes) of the cells of a
+        slab, ordered by column (i, then j) and then by layer k"""
+        rank, n2d = self._node_rank()
+        cols = self._columns()
+        nz = self.shape[2]
+        if axis == 'k':
+            ci, cj = np.nonzero(cols)
+            k = np.arange(start, stop)
+        else:
+            ci, cj = np.nonzero(cols[:, start:stop])
+            cj += start
+            k = np.arange(nz)
+        cells = np.empty((ci.size, k.size, 8), dtype=self.dtype)
+        for c, (di, dj, dk) in enumerate(HEXA_CORNERS):
+            r = rank[ci + di, cj + dj]
+            cells[:, :, c] = (k[None, :] + dk) * n2d + r[:, None]
+        return cells.reshape((-1, 8))
+
+    def compact(self, max_bytes=None, scratch_dir=None, name=None):
+        """materialize the grid clipped by columns, slab by slab. Returns a
+        tuple (ndarray nodes coordinate, ndarray cells connectivities), the same
+        of utilities.compact_mesh over the active cells, optionally backed by
+        files (see utilities.scratch_array)"""
+        nz = self.shape[2]
+        ncols = int(np.count_nonzero(self._columns()))
+        nodes = utils.scratch_array((self.n_slab_nodes(), 3), np.float64,
+                                    name and name + '_nodes', scratch_dir,
+                                    prefix='grid_nodes')
+        cells = utils.scratch_array((ncols * nz, 8), self.dtype,
+                                    name and name + '_cells', scratch_dir,
+                                    prefix='grid_cells')
+        # cells are ordered by column and then by layer
+        first = np.arange(ncols)[:, None] * nz
+        for start, stop in self.iter_slabs('k', max_bytes):
+            ids, coords = self.slab_nodes('k', start, stop)
+            nodes[ids[0]:ids[-1] + 1] = coords
+            pos = (first + np.arange(start, stop)[None, :]).ravel()
+            cells[pos] = self.slab_cells('k', start, stop)
+        return nodes, cells
+
+
+class PillarGrid(object):
+    """
+    Corner-point like grid. Every pillar is a line given by its bottom and top
+    points (COORD) and holds the z of the nlayer + 1 nodes along it (like ZCORN,
+    but shared by the cells around the pillar). The cells of a layer are the
+    columns given by 4 pillars (footprint quads), so column operations
+    (re-spacing, pinch-outs, horizon warping) are numpy operations along the
+    last axis of z instead of searches for nodes with the same (x, y).
+
+    Nodes are numbered by level and then by pillar (id = k * n_pillars + p) and
+    cells by column and then by layer k, the same of StructuredGrid.compact for
+    a grid built by from_structured.
+    """
+
+    def __init__(self, coord, z, quads, dtype='int64'):
+        self.coord = np.asarray(coord, dtype=np.float64).reshape((-1, 2, 3))
+        self.z = np.asarray(z, dtype=np.float64)
+        self.quads = np.asarray(quads, dtype=np.int64).reshape((-1, 4))
+        self.dtype = np.dtype(dtype)
+        if self.z.ndim != 2 or self.z.shape[0] != self.coord.shape[0]:
+            raise ValueError('z must have shape (n_pillars, n_layers + 1), got '
+                             '{} for {} pillars'.format(self.z.shape, self.coord.shape[0]))
+        utils._check_index_dtype(self.n_nodes, self.dtype)
+
+    # --------------------------------------------------------------------------
+    # sizes
+    @property
+    def n_pillars(self):
+        return self.coord.shape[0]
+
+    @property
+    def n_layers(self):
+        return self.z.shape[1] - 1
+
+    @property
+    def n_columns(self):
+        return self.quads.shape[0]
+
+    @property
+    def n_nodes(self):
+        return self.z.size
+
+    @property
+    def n_cells(self):
+        return self.n_columns * self.n_layers
+
+    # --------------------------------------------------------------------------
+    # geometry
+    def pillar_xy(self, z=None):
+        """(x, y) of the pillar lines at the given z, shape (n_pillars, m) (at
+        the pillar nodes if None). Vertical pillars keep their (x, y)"""
+        z = self.z if z is None else np.asarray(z, dtype=np.float64)
+        bottom, top = self.coord[:, 0, :], self.coord[:, 1, :]
+        dz = (top[:, 2] - bottom[:, 2])[:, None]
+        t = np.divide(z - bottom[:, 2, None], dz, out=np.zeros(z.shape),
+                      where=dz != 0)
+        x = bottom[:, 0, None] + t * (top[:, 0] - bottom[:, 0])[:, None]
+        y = bottom[:, 1, None] + t * (top[:, 1] - bottom[:, 1])[:, None]
+        return x, y
+
+    def thickness(self):
+        """thickness of the cells along the pillars, shape (n_pillars, n_layers)"""
+        return np.diff(self.z, axis=1)
+
+    def warp(self, top, base):
+        """place the nodes of every pillar linearly spaced between the base and
+        top horizons (z at the pillars), see column_levels"""
+        levels = np.arange(self.n_layers + 1)
+        self.z = column_levels(np.asarray(base, dtype=np.float64),
+                               np.asarray(top, dtype=np.float64),
+                               levels, self.n_layers).T
+
+    # --------------------------------------------------------------------------
+    # conversion to hexahedra
+    def node_coords(self):
+        """node coordinates (n_nodes, 3), level by level"""
+        x, y = self.pillar_xy()
+        nodes = np.empty((self.n_nodes, 3))
+        nodes[:, 0] = x.T.ravel()
+        nodes[:, 1] = y.T.ravel()
+        nodes[:, 2] = self.z.T.ravel()
+        return nodes
+
+    def cell_nodes(self):
+        """connectivities (n_cells, 8), the same corner ordering of CartGrid"""
+        n = self.n_pillars
+        k = np.arange(self.n_layers, dtype=np.int64) * n
+        cells = np.empty((self.n_columns, self.n_layers, 8), dtype=self.dtype)
+        cells[:, :, :4] = self.quads[:, None, :] + k[None, :, None]
+        cells[:, :, 4:] = cells[:, :, :4] + n
+        return cells.reshape((-1, 8))
+
+    def to_hex(self):
+        """Returns a tuple with:
+        (ndarray nodes coordinate, ndarray cells connectivities)"""
+        return self.node_coords(), self.cell_nodes()
+
+    # --------------------------------------------------------------------------
+    # constructors
+    @classmethod
+    def from_structured(cls, grid):
+        """pillar grid of a StructuredGrid (only the active columns if it was
+        clipped by columns), with vertical pillars"""
+        rank, n2d = grid._node_rank()
+        j, i = np.nonzero(rank.T >= 0)
+        coord = np.empty((n2d, 2, 3))
+        coord[:, :, 0] = grid.x[i, None]
+        coord[:, :, 1] = grid.y[j, None]
+        coord[:, 0, 2] = grid.z[0]
+        coord[:, 1, 2] = grid.z[-1]
+        z = np.tile(grid.z, (n2d, 1))
+        ci, cj = np.nonzero(grid._columns())
+        quads = np.column_stack([rank[ci + di, cj + dj]
+                                 for (di, dj, _) in HEXA_CORNERS[:4]])
+        return cls(coord, z, quads, dtype=grid.dtype)
+
+    @classmethod
+    def from_hex(cls, nodes, cells, tol=1e-9, dtype='int64'):
+        """
+        pillar grid of a conforming hexahedral mesh with vertical pillars, i.e.
+        nodes with the same (x, y) (within tol, see group_by_xy) and cells with
+        the corners 0-3 in the bottom face (CartGrid ordering). Raises a
+        ValueError if the pillars do not have the same number of nodes or the
+        cells do not stack on them (e.g. faults with split nodes).
+        """
+        nodes = np.asarray(nodes, dtype=np.float64)
+        cells = np.asarray(cells, dtype=np.int64)
+        pillar, n_pillars = group_by_xy(nodes[:, :2], tol)
+        count = np.bincount(pillar, minlength=n_pillars)
+        if np.any(count != count[0]):
+            raise ValueError('pillars with {} to {} nodes, a pillar grid needs the '
+                             'same number of nodes in all pillars'.format(
+                                 count.min(), count.max()))
+        n_levels = int(count[0])
+
+        # nodes sorted by pillar and then by z
+        order = np.lexsort((nodes[:, 2], pillar))
+        level = np.empty((nodes.shape[0],), dtype=np.int64)
+        level[order] = np.tile(np.arange(n_levels), n_pillars)
+        z = nodes[order, 2].reshape((n_pillars, n_levels))
+        coord = np.stack((nodes[order[::n_levels]],
+                          nodes[order[n_levels - 1::n_levels]]), axis=1)
+
+        # columns (in order of appearance) and layers of the cells
+        bottom = pillar[cells[:, :4]]
+        k = level[cells[:, 0]]
+        if (np.any(pillar[cells[:, 4:]] != bottom) or
+                np.any(level[cells[:, :4]] != k[:, None]) or
+                np.any(level[cells[:, 4:]] != k[:, None] + 1)):
+            raise ValueError('cells do not stack on the pillars')
+        quads, first, column = np.unique(bottom, axis=0, return_index=True,
+                                         return_inverse=True)
+        column = np.argsort(np.argsort(first))[column.ravel()]
+        quads = quads[np.argsort(first)]
+        n_layers = n_levels - 1
+        filled = np.zeros((quads.shape[0], n_layers), dtype=np.int64)
+        np.add.at(filled, (column, k), 1)
+        if np.any(filled != 1):
+            raise ValueError('cells do not stack on the pillars')
+        return cls(coord, z, quads, dtype=dtype)
+
+
+# ------------------------------------------------------------------------------
+def column_levels(base, top, levels, nz):
+    """
+    z coordinate of the levels of vertical columns linearly spaced between base
+    (level 0) and top (level nz), shape (levels.size, base.size). Same rule of
+    macros.CreateMeshFromTopBase: columns thinner than 1e-9 are opened 10 units
+    up and down, and the levels always increase from the lower horizon.
+    """
+    levels = np.asarray(levels)
+    thin = np.abs(top - base) <= 1e-9
+    start = np.where(thin, base - 10, base)
+    stop = np.where(thin, top + 10, top)
+    step = (stop - start) / nz
+    # inverted horizons (top below base) are flipped upside down
+    idx = np.where((stop < start)[None, :], nz - levels[:, None], levels[:, None])
+    z = idx * step[None, :] + start[None, :]
+    last = idx == nz
+    z[last] = np.broadcast_to(stop, z.shape)[last]
+    return z
+
+
+# ------------------------------------------------------------------------------
+def stratigraphic_grid(footprint, horizons, layers, min_thickness=0.0,
+                       chunk_size=1 << 16):
+    """
+    Conformal multi-unit grid between N horizons. Returns a tuple with:
+    (PillarGrid, ndarray material of the cells (unit number, starting at 1))
+
+    footprint: StructuredGrid (its active columns) or PillarGrid giving the
+    pillars (x, y); horizons: functions f(x, y) ordered from the base to the
+    top of the model; layers: number of layers of each of the N - 1 units.
+    Horizons are evaluated once per pillar (in blocks of chunk_size points);
+    where a horizon crosses the one below, it is pushed up to keep the unit at
+    least min_thickness thick (pinch-outs are flat cells by default).
+    """
+    layers = np.asarray(layers, dtype=np.int64).ravel()
+    if len(horizons) != layers.size + 1:
+        raise ValueError('{} horizons given for {} units'.format(
+            len(horizons), layers.size))
+    if np.any(layers < 1):
+        raise ValueError('every unit needs at least one layer')
+    if isinstance(footprint, StructuredGrid):
+        footprint = PillarGrid.from_structured(footprint)
+
+    # horizons at the pillars (n_pillars, N)
+    xp, yp = footprint.coord[:, 0, 0], footprint.coord[:, 0, 1]
+    h = np.empty((footprint.n_pillars, len(horizons)))
+    for c in range(0, footprint.n_pillars, chunk_size):
+        for u, fun in enumerate(horizons):
+            h[c:c + chunk_size, u] = fun(xp[c:c + chunk_size], yp[c:c + chunk_size])
+    for u in range(1, h.shape[1]):
+        h[:, u] = np.maximum(h[:, u], h[:, u - 1] + min_thickness)
+
+    # every level: unit below it and fraction of the unit thickness
+    unit = np.repeat(np.arange(layers.size), layers)
+    frac = np.concatenate([np.arange(n) / n for n in layers])
+    lower, upper = h[:, unit], h[:, unit + 1]
+    z = np.empty((footprint.n_pillars, layers.sum() + 1))
+    z[:, :-1] = lower + (upper - lower) * frac[None, :]
+    z[:, -1] = h[:, -1]
+
+    grid = PillarGrid(footprint.coord.copy(), z, footprint.quads.copy(),
+                      dtype=footprint.dtype)
+    mat = np.tile(unit + 1, footprint.n_columns)
+    return grid, mat
+
+
+# ------------------------------------------------------------------------------
+def _cluster_1d(v, tol):
+    """labels of values chained by gaps <= tol, increasing with the values"""
+    order = np.argsort(v, kind='stable')
+    labels = np.empty((v.size,), dtype=np.int64)
+    labels[order] = np.concatenate(([0], np.cumsum(np.diff(v[order]) > tol)))
+    return labels
+
+
+def group_by_xy(xy, tol=1e-9):
+    """
+    Group points with the same (x, y) within tol (e.g. the nodes of vertical
+    pillars) with sorting instead of comparing every pair of points. Returns a
+    tuple (ndarray group of each point, number of groups); groups are numbered
+    with x running fastest, then y.
+    """
+    xy = np.asarray(xy, dtype=np.float64)
+    if xy.shape[0] == 0:
+        return np.zeros((0,), dtype=np.int64), 0
+    gx = _cluster_1d(xy[:, 0], tol)
+    gy = _cluster_1d(xy[:, 1], tol)
+    keys, labels = np.unique(gy * (gx.max() + 1) + gx, return_inverse=True)
+    return labels.ravel(), keys.size
+
+
+def pillar_index(xy, z, tol=1e-9):
+    """
+    Index the points of vertical pillars in one pass: points are grouped by
+    (x, y) within tol (see group_by_xy) and pillars are numbered by their
+    lowest point id. Returns a tuple (pillar of each point, indptr, members,
+    top, bottom) where members[indptr[p]:indptr[p + 1]] are the point ids of
+    pillar p in ascending order and top/bottom are the ids of the highest and
+    lowest point of each pillar (the lowest id on ties).
+    """
+    z = np.asarray(z, dtype=np.float64)
+    labels, n = group_by_xy(xy, tol)
+    _, first = np.unique(labels, return_index=True)
+    rank = np.empty((n,), dtype=np.int64)
+    rank[np.argsort(first)] = np.arange(n)
+    pillar = rank[labels]
+
+    indptr = np.zeros((n + 1,), dtype=np.int64)
+    np.cumsum(np.bincount(pillar, minlength=n), out=indptr[1:])
+    members = np.argsort(pillar, kind='stable')
+    ids = np.arange(z.size)
+    top = np.lexsort((ids, -z, pillar))[indptr[:-1]]
+    bottom = np.lexsort((ids, z, pillar))[indptr[:-1]]
+    return pillar, indptr, members, top, bottom
@@ -0,0 +1,803 @@
+# Copyright (C) 2017-2020 JCT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author : Jonathan Teixeira (jonathan.teixeira@ufpe.br)
+#
+
+
+"""
+This file contains the interpolation of horizons z = f(x, y) from scattered
+points (no Salome dependencies)
+"""
+
+# plugin imports
+from . import utilities as utils
+
+# python imports
+import os
+import time
+import pickle
+import hashlib
+import itertools
+import collections
+import numpy as np
+import scipy.interpolate as inter
+from scipy.spatial import cKDTree
+
+import logging
+LOG = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# Local CONST.
+# interpolation backends:
+#   local    - radial basis functions fitted on the nearest neighbours of each
+#              evaluated point (scipy RBFInterpolator), scales to large sets
+#   rbf      - global radial basis functions (scipy Rbf), dense N x N system
+#   delaunay - piecewise linear or cubic (function) on the triangulation
+#   idw      - inverse distance weighting of the nearest neighbours
+METHODS = ('local', 'rbf', 'delaunay', 'idw')
+# scipy Rbf function names -> RBFInterpolator kernels
+KERNELS = {'multiquadric': 'multiquadric', 'inverse': 'inverse_multiquadric',
+           'gaussian': 'gaussian', 'linear': 'linear', 'cubic': 'cubic',
+           'quintic': 'quintic', 'thin_plate': 'thin_plate_spline'}
+# kernels depending on the shape parameter epsilon
+SCALED_KERNELS = ('multiquadric', 'inverse_multiquadric', 'gaussian')
+# kernels with the sign of the Rbf functions (the others are negated): Rbf
+# solves A - smooth * I and RBFInterpolator A + smoothing * I
+SAME_SIGN_KERNELS = ('cubic', 'thin_plate_spline', 'gaussian',
+                     'inverse_multiquadric')
+# bound of the points fitted from large files (see bin_xyz)
+MAX_FIT_POINTS = 200000
+# raster horizon files (see read_raster): ESRI ASCII grid, raw binary with a
+# .hdr header (ESRI GridFloat and alike) and rasters written by RasterHorizon
+RASTER_EXTENSIONS = ('.asc', '.flt', '.bin', '.raw', '.npy')
+# header pixel types not known by numpy
+PIXEL_TYPES = {'float': 'float32', 'floatingpoint': 'float32',
+               'double': 'float64'}
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+
+class Horizon(object):
+    """
+    Horizon z = f(x, y) fitted on scattered points, callable as the scipy Rbf
+    it replaces (f(x, y) with arrays of any shape). function keeps the Rbf
+    names (delaunay: 'linear' or 'cubic') and smooth the Rbf smoothing (not
+    used by delaunay and idw); neighbors is the number of nearest points used
+    by the local and idw methods and power the idw exponent. Outside the
+    convex hull of the points, delaunay takes the nearest point value. The
+    fit and the last evaluation times (seconds) are kept in fit_time and
+    eval_time.
+    """
+
+    def __init__(self, x, y, z, method='local', function='linear', smooth=100.,
+                 neighbors=50, power=2.):
+        if method not in METHODS:
+            raise ValueError('unknown interpolation method: {}'.format(method))
+        self.points = np.column_stack((np.ravel(x), np.ravel(y)))
+        self.points = self.points.astype(np.float64)
+        self.values = np.ravel(z).astype(np.float64)
+        self.method = method
+        self.function = function
+        self.smooth = smooth
+        self.neighbors = min(int(neighbors), self.values.size)
+        self.power = power
+        self.eval_time = 0.0
+
+        tic = time.time()
+        self._model = getattr(self, '_fit_' + method)()
+        self.fit_time = time.time() - tic
+        LOG.info('Horizon fitted (%s, %s, %d points) in %f seconds', method,
+                 function, self.values.size, self.fit_time)
+
+    @property
+    def n_points(self):
+        return self.values.size
+
+    def __call__(self, x, y):
+        tic = time.time()
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        shape = np.broadcast(x, y).shape
+        xy = np.column_stack((np.broadcast_to(x, shape).ravel(),
+                              np.broadcast_to(y, shape).ravel()))
+        z = getattr(self, '_eval_' + self.method)(xy).reshape(shape)
+        self.eval_time = time.time() - tic
+        LOG.debug('Horizon evaluated (%s, %d points) in %f seconds', self.method,
+                 xy.shape[0], self.eval_time)
+        return z
+
+    # --------------------------------------------------------------------------
+    # backends: _fit_<method> returns the fitted model (picklable, see
+    # HorizonCache), _eval_<method> evaluates it on (n, 2) points
+    def _epsilon(self):
+        """scipy Rbf default shape parameter (mean distance between points)"""
+        edges = np.ptp(self.points, axis=0)
+        edges = edges[edges > 0]
+        if edges.size == 0:
+            return 1.0
+        return np.power(np.prod(edges) / self.values.size, 1.0 / edges.size)
+
+    def _fit_rbf(self):
+        return inter.Rbf(self.points[:, 0], self.points[:, 1], self.values,
+                         function=self.function, smooth=self.smooth)
+
+    def _eval_rbf(self, xy):
+        return self._model(xy[:, 0], xy[:, 1])
+
+    def _fit_local(self):
+        if self.function not in KERNELS:
+            raise ValueError('unknown function: {}'.format(self.function))
+        kernel = KERNELS[self.function]
+        # same shape of the Rbf functions: phi(r / epsilon)
+        epsilon = 1.0 / self._epsilon() if kernel in SCALED_KERNELS else 1.0
+        # same regularization of the Rbf smooth, whatever the kernel sign
+        smoothing = -self.smooth if kernel in SAME_SIGN_KERNELS else self.smooth
+        return inter.RBFInterpolator(self.points, self.values,
+                                     neighbors=self.neighbors,
+                                     smoothing=smoothing, kernel=kernel,
+                                     epsilon=epsilon)
+
+    def _eval_local(self, xy):
+        return self._model(xy)
+
+    def _fit_delaunay(self):
+        if self.function == 'linear':
+            fun = inter.LinearNDInterpolator(self.points, self.values)
+        elif self.function == 'cubic':
+            fun = inter.CloughTocher2DInterpolator(self.points, self.values)
+        else:
+            raise ValueError('delaunay function must be linear or cubic')
+        return fun, cKDTree(self.points)
+
+    def _eval_delaunay(self, xy):
+        fun, tree = self._model
+        z = fun(xy)
+        out = np.isnan(z)
+        if np.any(out):
+            z[out] = self.values[tree.query(xy[out])[1]]
+        return z
+
+    def _fit_idw(self):
+        return cKDTree(self.points)
+
+    def _eval_idw(self, xy):
+        dist, idx = self._model.query(xy, k=self.neighbors)
+        dist = dist.reshape((xy.shape[0], -1))
+        idx = idx.reshape((xy.shape[0], -1))
+        w = np.zeros_like(dist)
+        np.power(dist, -self.power, out=w, where=dist > 0)
+        # points on a data point take its value
+        exact = dist[:, 0] == 0
+        w[exact] = 0
+        w[exact, 0] = 1
+        return np.sum(w * self.values[idx], axis=1) / np.sum(w, axis=1)
+
+
+# ------------------------------------------------------------------------------
+class RasterHorizon(object):
+    """
+    Horizon z = f(x, y) sampled on a regular raster: values (ny, nx) at the
+    nodes x0 + i * dx, y0 + j * dy (dy < 0 for rows stored from the north).
+    Queries are bilinear interpolations from the 4 nodes around each point,
+    found by index arithmetic (constant beyond the raster edges); nodes equal
+    to nodata are left out of the weights (NaN if all 4 are). Callable as
+    Horizon; max_deviation is the largest difference from the sampled
+    function measured by from_function. Memory mapped values (see
+    read_raster) are pickled by reference to their file.
+    """
+
+    def __init__(self, values, x0, y0, dx, dy, max_deviation=None, nodata=None):
+        self.values = values
+        self.x0, self.y0 = float(x0), float(y0)
+        self.dx, self.dy = float(dx), float(dy)
+        self.max_deviation = max_deviation
+        self.nodata = nodata
+        self.eval_time = 0.0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        v = self.values
+        if isinstance(v, np.memmap) and v.filename is not None:
+            state['values'] = ('memmap', v.filename, v.dtype.str, v.shape,
+                               v.offset)
+        return state
+
+    def __setstate__(self, state):
+        v = state['values']
+        if isinstance(v, tuple):
+            _, filename, dtype, shape, offset = v
+            state['values'] = np.memmap(filename, dtype=dtype, mode='r',
+                                        shape=shape, offset=offset)
+        self.__dict__.update(state)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def x(self):
+        return self.x0 + self.dx * np.arange(self.shape[1])
+
+    @property
+    def y(self):
+        return self.y0 + self.dy * np.arange(self.shape[0])
+
+    def __call__(self, x, y, chunk_size=1 << 20):
+        tic = time.time()
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        shape = np.broadcast(x, y).shape
+        x = np.broadcast_to(x, shape).ravel()
+        y = np.broadcast_to(y, shape).ravel()
+        z = np.empty((x.size,))
+        for c in range(0, x.size, chunk_size):
+            z[c:c + chunk_size] = self._bilinear(x[c:c + chunk_size],
+                                                 y[c:c + chunk_size])
+        self.eval_time = time.time() - tic
+        return z.reshape(shape)
+
+    def _bilinear(self, x, y):
+        ny, nx = self.shape
+        fx = np.clip((x - self.x0) / self.dx, 0, nx - 1)
+        fy = np.clip((y - self.y0) / self.dy, 0, ny - 1)
+        i = np.minimum(fx.astype(np.int64), max(nx - 2, 0))
+        j = np.minimum(fy.astype(np.int64), max(ny - 2, 0))
+        tx, ty = fx - i, fy - j
+        i1, j1 = np.minimum(i + 1, nx - 1), np.minimum(j + 1, ny - 1)
+        v = self.values
+        if self.nodata is None:
+            return ((1 - ty) * ((1 - tx) * v[j, i] + tx * v[j, i1]) +
+                    ty * ((1 - tx) * v[j1, i] + tx * v[j1, i1]))
+
+        # weights of the valid nodes only
+        z = np.zeros(x.shape)
+        wsum = np.zeros(x.shape)
+        for jj, ii, w in ((j, i, (1 - tx) * (1 - ty)), (j, i1, tx * (1 - ty)),
+                          (j1, i, (1 - tx) * ty), (j1, i1, tx * ty)):
+            c = np.asarray(v[jj, ii], dtype=np.float64)
+            w = np.where(c != self.nodata, w, 0.)
+            z += w * np.where(w > 0, c, 0.)
+            wsum += w
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(wsum > 0, z / wsum, np.nan)
+
+    @classmethod
+    def from_function(cls, fun, bbox, dx, dy=None, check_points=100000,
+                      chunk_size=1 << 20):
+        """
+        Sample fun(x, y) on a raster covering bbox (xmin, ymin, xmax, ymax)
+        with cell size dx (and dy, default dx). The deviation is measured at
+        up to check_points cell centres, where bilinear errors peak.
+        """
+        dy = dx if dy is None else dy
+        xmin, ymin, xmax, ymax = [float(b) for b in bbox]
+        nx = max(int(np.ceil((xmax - xmin) / dx)), 1) + 1
+        ny = max(int(np.ceil((ymax - ymin) / dy)), 1) + 1
+        tic = time.time()
+        raster = cls(np.empty((ny, nx)), xmin, ymin, dx, dy)
+        x = raster.x
+        rows = max(chunk_size // nx, 1)
+        for j in range(0, ny, rows):
+            yy = raster.y[j:j + rows]
+            raster.values[j:j + rows] = fun(*np.meshgrid(x, yy))
+
+        # deviation at the centres of a subset of the cells
+        step = max(int(np.sqrt((nx - 1) * (ny - 1) / check_points)), 1)
+        xc = x[:-1:step] + 0.5 * dx
+        yc = raster.y[:-1:step] + 0.5 * dy
+        xc, yc = np.meshgrid(xc, yc)
+        raster.max_deviation = float(np.max(np.abs(raster(xc, yc) - fun(xc, yc))))
+        LOG.info('Horizon rasterized (%d x %d, dx=%g, dy=%g) in %f seconds, '
+                 'max deviation %g', nx, ny, dx, dy, time.time() - tic,
+                 raster.max_deviation)
+        return raster
+
+    def save(self, fname):
+        """write the raster to fname.npy and its header to fname.hdr"""
+        np.save(fname + '.npy', self.values)
+        write_header(fname + '.hdr', ncols=self.shape[1], nrows=self.shape[0],
+                     xorigin=self.x0, yorigin=self.y0, dx=self.dx, dy=self.dy,
+                     max_deviation=self.max_deviation, nodata=self.nodata)
+
+    @classmethod
+    def load(cls, fname, mmap_mode='r'):
+        """raster written by save (memory mapped by default)"""
+        h = read_header(fname + '.hdr')
+        values = np.load(fname + '.npy', mmap_mode=mmap_mode)
+        if values.shape != (int(h['nrows']), int(h['ncols'])):
+            raise ValueError('{}.npy does not match its header'.format(fname))
+        return cls(values, h['xorigin'], h['yorigin'], h['dx'], h['dy'],
+                   h.get('max_deviation'), h.get('nodata'))
+
+
+# ------------------------------------------------------------------------------
+def write_header(fname, **fields):
+    """write a raster header: one 'key value' line per field"""
+    with open(fname, 'w') as f:
+        for key, value in fields.items():
+            if value is not None:
+                if isinstance(value, float):
+                    value = repr(float(value))
+                f.write('{} {}\n'.format(key, value))
+
+
+def read_header(fname):
+    """raster header written by write_header (numbers as float)"""
+    fields = {}
+    with open(fname) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 2:
+                continue
+            try:
+                fields[parts[0].lower()] = float(parts[1])
+            except ValueError:
+                fields[parts[0].lower()] = parts[1]
+    return fields
+
+
+# ------------------------------------------------------------------------------
+def is_raster(fname):
+    """True if fname is a raster horizon file (see RASTER_EXTENSIONS)"""
+    return os.path.splitext(fname)[1].lower() in RASTER_EXTENSIONS
+
+
+def read_raster(fname, cache=True):
+    """
+    RasterHorizon of a raster file, memory mapped so nothing is fitted and
+    rasters larger than the memory can be used:
+      .asc             - ESRI ASCII grid, converted once to a binary raster in
+                         the cache directory (see HorizonCache)
+      .flt, .bin, .raw - raw binary rows (north first) described by a .hdr
+                         file with the ESRI keys (ncols, nrows, xllcorner or
+                         xllcenter, yllcorner or yllcenter, cellsize or dx and
+                         dy, nodata_value, byteorder) and an optional
+                         pixeltype (float32 by default)
+      .npy             - raster written by RasterHorizon.save
+    """
+    ext = os.path.splitext(fname)[1].lower()
+    tic = time.time()
+    if ext == '.asc':
+        raster = _read_esri_ascii(fname, cache)
+    elif ext == '.npy':
+        raster = RasterHorizon.load(fname[:-len(ext)])
+    elif ext in RASTER_EXTENSIONS:
+        raster = _read_binary_raster(fname)
+    else:
+        raise ValueError('{} is not a raster horizon file'.format(fname))
+    LOG.info('Raster horizon %s (%d x %d) mapped in %f seconds', fname,
+             raster.shape[1], raster.shape[0], time.time() - tic)
+    return raster
+
+
+def _esri_geometry(h):
+    """(x0, y0, dx, dy, nodata) of the north-west node of an ESRI header"""
+    nrows = int(h['nrows'])
+    dx = float(h.get('dx', h.get('cellsize', 0.)))
+    dy = float(h.get('dy', h.get('cellsize', 0.)))
+    if dx <= 0 or dy <= 0:
+        raise ValueError('raster header without a valid cell size')
+    if 'xllcenter' in h:
+        x0 = h['xllcenter']
+    else:
+        x0 = h['xllcorner'] + 0.5 * dx
+    if 'yllcenter' in h:
+        y0 = h['yllcenter'] + (nrows - 1) * dy
+    else:
+        y0 = h['yllcorner'] + (nrows - 0.5) * dy
+    return x0, y0, dx, -dy, h.get('nodata_value')
+
+
+def _read_binary_raster(fname):
+    hdr = os.path.splitext(fname)[0] + '.hdr'
+    h = read_header(hdr)
+    pixeltype = str(h.get('pixeltype', 'float32')).lower()
+    dtype = np.dtype(PIXEL_TYPES.get(pixeltype, pixeltype))
+    order = str(h.get('byteorder', 'lsbfirst')).lower()
+    dtype = dtype.newbyteorder('>' if order in ('msbfirst', 'm') else '<')
+    shape = (int(h['nrows']), int(h['ncols']))
+    if os.path.getsize(fname) < shape[0] * shape[1] * dtype.itemsize:
+        raise ValueError('{} is smaller than described in {}'.format(fname, hdr))
+    x0, y0, dx, dy, nodata = _esri_geometry(h)
+    values = np.memmap(fname, dtype=dtype, mode='r', shape=shape)
+    return RasterHorizon(values, x0, y0, dx, dy, nodata=nodata)
+
+
+def _read_esri_ascii(fname, cache=True, chunk_rows=1 << 10):
+    if cache is True:
+        cache = default_cache()
+    cache_dir = cache.cache_dir if cache else utils.GetCacheDirectory()
+    path = os.path.join(cache_dir,
+                        'raster_' + HorizonCache.key(fname, format='asc') + '.npy')
+
+    with open(fname) as f:
+        # header: 'key value' lines up to the first row of values
+        h = {}
+        pos = f.tell()
+        line = f.readline()
+        while line and line.split() and line.split()[0][0].isalpha():
+            key, value = line.split()[:2]
+            h[key.lower()] = float(value)
+            pos = f.tell()
+            line = f.readline()
+        x0, y0, dx, dy, nodata = _esri_geometry(h)
+        shape = (int(h['nrows']), int(h['ncols']))
+        if cache:
+            try:
+                values = np.load(path, mmap_mode='r')
+                os.utime(path)
+                if values.shape == shape:
+                    return RasterHorizon(values, x0, y0, dx, dy, nodata=nodata)
+            except (OSError, ValueError):
+                pass
+
+        # values streamed to a binary copy (rows may wrap over lines)
+        f.seek(pos)
+        tmp = path + '.{}.tmp'.format(os.getpid())
+        values = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float64,
+                                           shape=shape)
+        flat = values.reshape(-1)
+        n = 0
+        while n < flat.size:
+            block = ''.join(itertools.islice(f, chunk_rows))
+            if not block:
+                break
+            v = np.array(block.split(), dtype=np.float64)
+            flat[n:n + v.size] = v[:flat.size - n]
+            n += v.size
+        values.flush()
+        del flat, values
+    if n < shape[0] * shape[1]:
+        HorizonCache._remove(tmp)
+        raise ValueError('{} has {} values instead of {}'.format(
+            fname, n, shape[0] * shape[1]))
+    os.replace(tmp, path)
+    if cache:
+        cache._evict(keep=(path,))
+    values = np.load(path, mmap_mode='r')
+    return RasterHorizon(values, x0, y0, dx, dy, nodata=nodata)
+
+
+# ------------------------------------------------------------------------------
+def iter_xyz(fname, chunk_rows=1 << 20, skiprows=1):
+    """
+    Stream a tagged xyz file (ID x y z columns after skiprows header lines):
+    yields (n, 3) arrays of at most chunk_rows points, so files larger than
+    memory can be read.
+    """
+    with open(fname) as f:
+        for _ in range(skiprows):
+            f.readline()
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                break
+            d = np.loadtxt(lines, usecols=[1, 2, 3], ndmin=2)
+            if d.shape[0] > 0:
+                yield d
+
+
+def _bin_groups(ix, iy):
+    """start of the runs of equal bins (ix, iy) of sorted rows"""
+    new = np.ones((ix.size,), dtype=bool)
+    new[1:] = (ix[1:] != ix[:-1]) | (iy[1:] != iy[:-1])
+    return new
+
+
+def _reduce_bins(ix, iy, count, sums):
+    """merge the rows of the same bin (ix, iy): counts and sums add up"""
+    order = np.lexsort((iy, ix))
+    start = np.flatnonzero(_bin_groups(ix[order], iy[order]))
+    order_start = order[start]
+    return (ix[order_start], iy[order_start],
+            np.add.reduceat(count[order], start),
+            np.add.reduceat(sums[order], start, axis=0))
+
+
+def _reduce_sketch(ix, iy, w, v, slots):
+    """
+    Merge the weighted values (w, v) of each bin (ix, iy) into at most slots
+    rows of consecutive quantiles (weight sum and weighted mean): a bounded
+    summary of the distribution of each bin, exact up to slots values.
+    """
+    order = np.lexsort((v, iy, ix))
+    ix, iy, w, v = ix[order], iy[order], w[order], v[order]
+    new = _bin_groups(ix, iy)
+    group = np.cumsum(new) - 1
+    start = np.flatnonzero(new)
+    total = np.add.reduceat(w, start)
+    cum = np.cumsum(w)
+    before = cum - w - (cum[start] - w[start])[group]
+    slot = np.floor(before * slots / total[group]).astype(np.int64)
+    first = new.copy()
+    first[1:] |= slot[1:] != slot[:-1]
+    start = np.flatnonzero(first)
+    wsum = np.add.reduceat(w, start)
+    return ix[start], iy[start], wsum, np.add.reduceat(w * v, start) / wsum
+
+
+def _sketch_median(ix, iy, w, v):
+    """weighted (lower) median of each bin of a sketch (see _reduce_sketch)"""
+    order = np.lexsort((v, iy, ix))
+    ix, iy, w, v = ix[order], iy[order], w[order], v[order]
+    new = _bin_groups(ix, iy)
+    group = np.cumsum(new) - 1
+    start = np.flatnonzero(new)
+    total = np.add.reduceat(w, start)
+    cum = np.cumsum(w)
+    within = cum - (cum[start] - w[start])[group]
+    row = np.where(2 * within >= total[group], np.arange(ix.size), ix.size)
+    return ix[start], iy[start], v[np.minimum.reduceat(row, start)]
+
+
+def bin_xyz(chunks, dx, dy=None, statistic='mean', max_points=None, slots=64):
+    """
+    Thin a stream of (n, 3) point arrays (see iter_xyz) on a grid of bins of
+    dx by dy (e.g. the cells of the target model): each bin is represented
+    by the mean x and y of its points and the mean or median z (statistic).
+    Memory is bounded by the number of bins: one row per bin, plus up to
+    slots quantiles per bin for the median (exact for bins with at most slots
+    points). With max_points the bins are doubled until there are at most
+    max_points of them. Returns a (n, 3) array.
+    """
+    if statistic not in ('mean', 'median'):
+        raise ValueError('unknown statistic: {}'.format(statistic))
+    dy = dx if dy is None else dy
+    median = statistic == 'median'
+    bins = sketch = None
+    n_read = 0
+    for d in chunks:
+        n_read += d.shape[0]
+        cx = np.floor(d[:, 0] / dx).astype(np.int64)
+        cy = np.floor(d[:, 1] / dy).astype(np.int64)
+        ones = np.ones((d.shape[0],), dtype=np.int64)
+        rows = (cx, cy, ones, d)
+        if bins is not None:
+            rows = [np.concatenate(r) for r in zip(bins, rows)]
+        bins = _reduce_bins(*rows)
+        if median:
+            rows = (cx, cy, ones.astype(np.float64), d[:, 2])
+            if sketch is not None:
+                rows = [np.concatenate(r) for r in zip(sketch, rows)]
+            sketch = _reduce_sketch(*rows, slots)
+    if bins is None:
+        return np.zeros((0, 3))
+
+    ix, iy, count, sums = bins
+    while max_points is not None and ix.size > max_points:
+        ix, iy, count, sums = _reduce_bins(ix // 2, iy // 2, count, sums)
+        if median:
+            sketch = _reduce_sketch(sketch[0] // 2, sketch[1] // 2, sketch[2],
+                                    sketch[3], slots)
+        dx, dy = 2 * dx, 2 * dy
+    LOG.info('%d points thinned to %d bins of %g x %g (%s)', n_read, ix.size,
+             dx, dy, statistic)
+
+    points = sums / count[:, None]
+    if median:
+        # bins and sketch rows are both sorted by (ix, iy)
+        points[:, 2] = _sketch_median(*sketch)[2]
+    return points
+
+
+def read_xyz(fname, max_points=MAX_FIT_POINTS, statistic='mean'):
+    """
+    Points (n, 3) of a tagged xyz file (see iter_xyz), at most max_points of
+    them (None: all): a file with more points is thinned by bin_xyz on bins
+    sized from its bounding box (about max_points bins), found while the
+    file is streamed once to count them.
+    """
+    chunks, n = [], 0
+    lo, hi = np.full((2,), np.inf), np.full((2,), -np.inf)
+    for d in iter_xyz(fname):
+        n += d.shape[0]
+        lo = np.minimum(lo, d[:, :2].min(axis=0))
+        hi = np.maximum(hi, d[:, :2].max(axis=0))
+        if chunks is not None:
+            chunks.append(d)
+            if max_points is not None and n > max_points:
+                chunks = None
+    if chunks is not None:
+        return np.concatenate(chunks or [np.zeros((0, 3))])
+
+    # square bins of size s covering the bounding box (w, h) with at most
+    # (w / s + 1) * (h / s + 1) = max_points bins
+    w, h = hi - lo
+    m = max(max_points - 1, 1)
+    size = ((w + h) + np.sqrt((w + h) ** 2 + 4 * m * w * h)) / (2 * m)
+    return bin_xyz(iter_xyz(fname), size if size > 0 else 1.0, None, statistic,
+                   max_points)
+
+
+# ------------------------------------------------------------------------------
+class HorizonCache(object):
+    """
+    Fitted horizons cached in memory and as pickles in a directory on disk,
+    keyed by the horizon file (path, size and modification time) and the
+    interpolation parameters, so an unchanged file is neither read nor fitted
+    again. Both levels drop the least recently used horizons: beyond max_items
+    in memory and beyond max_bytes on disk (see utilities.GetCacheDirectory
+    and utilities.GetCacheSize).
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None, max_items=8):
+        self.cache_dir = utils.GetCacheDirectory(cache_dir)
+        self.max_bytes = utils.GetCacheSize(max_bytes)
+        self.max_items = max_items
+        self._memory = collections.OrderedDict()
+
+    @staticmethod
+    def key(fname, **params):
+        """cache key of the horizon file fname fitted with params"""
+        st = os.stat(fname)
+        token = repr((os.path.abspath(fname), st.st_size, st.st_mtime_ns,
+                      sorted(params.items())))
+        return hashlib.sha1(token.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, 'horizon_' + key + '.pkl')
+
+    def get(self, key):
+        """cached horizon or None"""
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                horizon = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            LOG.warning('Dropping unreadable cache file %s', path)
+            self._remove(path)
+            return None
+        self._remember(key, horizon)
+        return horizon
+
+    def put(self, key, horizon):
+        """cache a horizon in memory and on disk"""
+        self._remember(key, horizon)
+        if self.max_bytes == 0:
+            return
+        path = self._path(key)
+        tmp = path + '.{}.tmp'.format(os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(horizon, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+        except Exception:
+            LOG.warning('Horizon not cached on disk (%s)', path)
+            self._remove(tmp)
+            return
+        self._evict()
+
+    def clear(self):
+        """drop all the cached horizons (memory and disk)"""
+        self._memory.clear()
+        for path in self._files():
+            self._remove(path)
+
+    def _remember(self, key, horizon):
+        self._memory[key] = horizon
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _files(self):
+        return [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir)
+                if (f.startswith('horizon_') and f.endswith('.pkl')) or
+                (f.startswith('raster_') and f.endswith('.npy'))]
+
+    def _evict(self, keep=()):
+        """remove the least recently used files beyond max_bytes (but keep)"""
+        files = []
+        for path in self._files():
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        total = sum(f[1] for f in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path not in keep:
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_CACHE = None
+
+
+def default_cache():
+    """HorizonCache shared by the plugin (created on first use)"""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = HorizonCache()
+    return _CACHE
+
+
+# ------------------------------------------------------------------------------
+def load_horizon(fname, method='local', function='linear', smooth=100.,
+                 cache=True, raster_size=None, bbox=None, bin_size=None,
+                 statistic='mean', max_points=MAX_FIT_POINTS, **kwargs):
+    """
+    Horizon (see Horizon) fitted on the points of a tagged xyz file (ID x y z
+    columns after one header line, streamed by iter_xyz), at most max_points
+    of them (None: all the points). With bin_size (dx or (dx, dy), e.g. the
+    model cells) the points are thinned by bin_xyz before the fit, otherwise
+    only files with more than max_points are (see read_xyz). With cache (True for default_cache,
+    or a HorizonCache) an unchanged file fitted with the same parameters is
+    taken from the cache; cache=False always fits. With raster_size the
+    fitted horizon is sampled once on a raster of that cell size over bbox
+    (xmin, ymin, xmax, ymax) and a RasterHorizon is returned (and cached)
+    instead. Raster files (see is_raster) are mapped by read_raster and used
+    as given, without any fit.
+    """
+    if is_raster(fname):
+        return read_raster(fname, cache=cache)
+    if cache is True:
+        cache = default_cache()
+    params = dict(method=method, function=function, smooth=smooth,
+                  statistic=statistic, max_points=max_points, **kwargs)
+    if bin_size is not None:
+        bin_size = tuple(float(b) for b in np.broadcast_to(bin_size, (2,)))
+        params.update(bin_size=bin_size)
+    if raster_size:
+        if bbox is None:
+            raise ValueError('a raster horizon needs a bounding box')
+        params.update(raster_size=float(raster_size),
+                      bbox=tuple(float(b) for b in bbox))
+    if cache:
+        key = cache.key(fname, **params)
+        horizon = cache.get(key)
+        if horizon is not None:
+            LOG.info('Horizon %s taken from the cache', fname)
+            return horizon
+
+    if raster_size:
+        exact = load_horizon(fname, method=method, function=function,
+                             smooth=smooth, cache=cache, bin_size=bin_size,
+                             statistic=statistic, max_points=max_points,
+                             **kwargs)
+        horizon = RasterHorizon.from_function(exact, bbox, raster_size)
+    else:
+        if bin_size is None:
+            d = read_xyz(fname, max_points, statistic)
+        else:
+            d = bin_xyz(iter_xyz(fname), bin_size[0], bin_size[1], statistic,
+                        max_points)
+        horizon = Horizon(d[:, 0], d[:, 1], d[:, 2], method=method,
+                          function=function, smooth=smooth, **kwargs)
+    if cache:
+        cache.put(key, horizon)
+    return horizon
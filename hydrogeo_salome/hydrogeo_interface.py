@@ -33,7 +33,6 @@ except ImportError:
     from PyQt5 import QtWidgets as QtGui
     from PyQt5 import QtCore
 import numpy as np
-from matplotlib import path
 import logging
 
 # salome imports
@@ -45,7 +44,9 @@ from . import dialog_ui_grid as dialog_grid
 from . import dialog_ui_bdr as dialog_bdr
 from . import dialog_ui_export as dialog_export
 from hydrogeo_salome import utilities as utils
+from hydrogeo_salome import grids
 from hydrogeo_salome import macros
+from hydrogeo_salome import polygons
 
 global plugin_initialized
 plugin_initialized = False
@@ -80,6 +81,29 @@ def deletePreviewGroupMesh(preview_mesh_obj):
     return preview_mesh_obj
 
 
+def constrainedGrid(nx, ny, nz, limits, scratch_dir=None):
+    """Build a cartesian grid (unit thickness) over the bounding box of limits
+    (polygons.Polygon or (n, 2) vertices) and keep only the cells inside the
+    model area. Returns a tuple with: (ndarray nodes coordinate, ndarray
+    cells connectivities), memory mapped with a scratch directory (see
+    utilities.GetScratchDirectory)"""
+    LOG = logging.getLogger(__name__)
+
+    limits = polygons.as_polygon(limits)
+    xmin, ymin, xmax, ymax = limits.bbox
+    x = np.linspace(xmin, xmax, nx + 1)
+    y = np.linspace(ymin, ymax, ny + 1)
+    z = np.linspace(0, 1, nz + 1)
+    LOG.info("generating cartesian grid")
+    grid = grids.StructuredGrid(x, y, z)
+
+    # remove cells out of limtis (same footprint for all layers)
+    LOG.info("remove cells out of limtis")
+    grid.clip_columns(limits)
+    # select (and renumber) cells and vertices inside constrant area
+    return grid.compact(scratch_dir=scratch_dir)
+
+
 # ========================================================================
 # CARTESIAN GRID MODEL: build a grid model (cartesian grid) and recycled 
 # for every call.
@@ -226,29 +250,7 @@ def constraint_grid_model(context):
                                     'Something wrong with the model area limits, Check it!')
             LOG.critical('Something wrong with the model area limits, Check it!')
             return
-        x = np.linspace(np.min(limits[:,0]), np.max(limits[:,0]), nx +1)
-        y = np.linspace(np.min(limits[:,1]), np.max(limits[:,1]), ny + 1)
-        z = np.linspace(0, 1, nz + 1)
-        LOG.info("generating cartesian grid")
-        (nodes, cells) = utils.CartGrid(x,y,z)
-
-        # compute cells centers
-        cell_center = np.zeros((cells.shape[0], 3))
-        for c in range(cells.shape[0]):
-            cell_center[c, :] = np.mean(nodes[cells[c, :], :], axis=0)
-
-        # remove cells out of limtis
-        LOG.info("remove cells out of limtis")
-        p = path.Path(limits)
-        msk = p.contains_points(cell_center[:, [0, 1]])
-        # select cells and vertices inside constrant area
-        cnodes = cells[msk]
-        vnodes = np.unique(cnodes.reshape(cnodes.size))
-        # rearrange the cells and nodes
-        idx = np.zeros((int(vnodes.max()+1),))
-        idx[vnodes] = np.arange(0, vnodes.size)
-        vert = nodes[vnodes]
-        hexa = np.int64(np.reshape(idx[cnodes].ravel(), (cnodes.shape[0], 8)))
+        vert, hexa = constrainedGrid(nx, ny, nz, limits)
 
         # create a smesh
         LOG.info("Creating SMESH")
@@ -294,28 +296,7 @@ def constraint_grid_model(context):
                                     'Something wrong with the model area limits, Check it!')
             LOG.critical('Something wrong with the model area limits, Check it!')
             return
-        x = np.linspace(np.min(limits[:,0]), np.max(limits[:,0]), nx +1)
-        y = np.linspace(np.min(limits[:,1]), np.max(limits[:,1]), ny + 1)
-        z = np.linspace(0, 1, nz + 1)
-        LOG.info("generating cartesian grid")
-        (nodes, cells) = utils.CartGrid(x,y,z)
-
-        # compute cells centers
-        cell_center = np.zeros((cells.shape[0], 3))
-        for c in range(cells.shape[0]):
-            cell_center[c, :] = np.mean(nodes[cells[c, :], :], axis=0)
-
-        # remove cells out of limtis
-        p = path.Path(limits)
-        msk = p.contains_points(cell_center[:, [0, 1]])
-        # select cells and vertices inside constrant area
-        cnodes = cells[msk]
-        vnodes = np.unique(cnodes.reshape(cnodes.size))
-        # rearrange the cells and nodes
-        idx = np.zeros((int(vnodes.max()+1),))
-        idx[vnodes] = np.arange(0, vnodes.size)
-        vert = nodes[vnodes]
-        hexa = np.int64(np.reshape(idx[cnodes].ravel(), (cnodes.shape[0], 8)))
+        vert, hexa = constrainedGrid(nx, ny, nz, limits)
 
         # create a smesh
         LOG.info("Creating SMESH")
@@ -27,14 +27,23 @@ This file contains utility functions for interacting with Salome
 
 # plugin imports
 from . import utilities as utils
+from . import geometry
+from . import grids
+from . import horizons
+from . import quality
+from . import parallel
+from . import polygons
 
 # python imports
-import scipy.interpolate as inter
+import os
 import time
 import numpy as np
 import logging
 LOG = logging.getLogger(__name__)
 
+# colors (r, g, b) of the boundary groups of each side (see geometry.SIDES)
+SIDE_COLORS = [(1, 0, 0), (1, 1, 0), (0, 1, 0), (0, 1, 1), (1, 0, 1), (0, 0, 1)]
+
 
 # ------------------------------------------------------------------------------
 # ------------------------------------------------------------------------------
@@ -70,6 +79,21 @@ def PrintMeshInfo(theMesh):
     pass
 
 
+# ------------------------------------------------------------------------------
+def CheckMeshQuality(nodes, cells, bins=10, workers=None):
+    """Compute and log the quality of hexahedral cells (see
+    geometry.GridGeometry.quality), in parallel with more than one worker (see
+    utilities.GetNumWorkers). Returns a tuple (per-cell metrics, summary)"""
+    tic = time.time()
+    metrics = geometry.GridGeometry(nodes, cells, workers).quality
+    summary = quality.quality_summary(metrics, bins)
+    LOG.info("Mesh quality (%f seconds)\n%s", time.time() - tic,
+             quality.format_summary(summary))
+    if summary['inverted'] > 0:
+        LOG.warning('** %d inverted cell(s) found!', summary['inverted'])
+    return metrics, summary
+
+
 # ------------------------------------------------------------------------------
 def LoadSMesh(fname: str):
     """Creates a SMESH object importing from file data"""
@@ -117,6 +141,74 @@ def LoadSMesh(fname: str):
     return M
 
 
+# ------------------------------------------------------------------------------
+def MeshGeometry(mesh, workers=None):
+    """
+    Geometry of the hexahedra of a SMESH mesh (see geometry.GridGeometry),
+    built from its node and connectivity arrays and cached on the mesh object
+    until the mesh is modified (see GetMTime), so the macros working on the
+    same mesh share it. Returns a tuple (GridGeometry, SMESH ids of its nodes).
+    """
+    import SMESH
+
+    key = (mesh.GetMTime(), mesh.NbNodes(), mesh.NbElements())
+    cache = getattr(mesh, '_grid_geometry', None)
+    if cache is None or cache['key'] != key:
+        LOG.debug("Collecting nodes and hexahedra of %s", mesh.GetName())
+        ids = np.array(mesh.GetNodesId(), dtype=np.int64)
+        nodes = np.array([mesh.GetNodeXYZ(int(i)) for i in ids]).reshape(-1, 3)
+        cells = [mesh.GetElemNodes(e) for e in mesh.GetElementsByType(SMESH.VOLUME)]
+        cells = np.array([c for c in cells if len(c) == 8],
+                         dtype=np.int64).reshape(-1, 8)
+        # SMESH ids to 0-based indexes
+        order = np.argsort(ids)
+        cells = order[np.searchsorted(ids, cells, sorter=order)]
+        cache = {'key': key, 'ids': ids, 'faces': None,
+                 'geometry': geometry.GridGeometry(nodes, cells, workers)}
+        try:
+            mesh._grid_geometry = cache
+        except AttributeError:
+            pass
+    return cache['geometry'], cache['ids']
+
+
+# ------------------------------------------------------------------------------
+def BoundaryFaceIds(mesh, faces, workers=None):
+    """
+    SMESH ids of the face elements (e.g. the 'Boundary_Faces' group) on the
+    boundary faces of the mesh geometry (see MeshGeometry), ordered as
+    geometry.GridGeometry.boundary_faces, 0 where no face element matches.
+    Faces are matched by their nodes, once per mesh state and list of faces.
+    Returns a tuple (GridGeometry, ids).
+    """
+    geom, ids = MeshGeometry(mesh, workers)
+    faces = np.asarray(faces, dtype=np.int64)
+    cache = getattr(mesh, '_grid_geometry', {})
+    if cache.get('faces') is not None and np.array_equal(cache['faces'][0], faces):
+        return geom, cache['faces'][1]
+
+    # sorted node ids as keys, equal keys are adjacent once sorted (the face
+    # elements first, lexsort is stable)
+    c, f = geom.boundary_faces
+    bkeys = ids[geom.face_nodes[c, f]]
+    fkeys = [mesh.GetElemNodes(int(e)) for e in faces]
+    quads = np.array([len(k) == 4 for k in fkeys], dtype=bool)
+    fkeys = np.array([k for k in fkeys if len(k) == 4], dtype=np.int64).reshape(-1, 4)
+    keys = np.sort(np.concatenate((fkeys, bkeys)), axis=1)
+    order = np.lexsort(keys.T[::-1])
+    a, b = order[:-1], order[1:]
+    n_f = fkeys.shape[0]
+    hit = np.all(keys[a] == keys[b], axis=1) & (a < n_f) & (b >= n_f)
+    bfaces = np.zeros((bkeys.shape[0],), dtype=np.int64)
+    bfaces[b[hit] - n_f] = faces[quads][a[hit]]
+    if np.any(bfaces == 0):
+        LOG.warning('%d boundary face(s) without face element',
+                    np.sum(bfaces == 0))
+    if 'key' in cache:
+        cache['faces'] = (faces, bfaces)
+    return geom, bfaces
+
+
 # ------------------------------------------------------------------------------
 def CreateBorderGroups(init_mesh):
     """Create boundary groups on mesh object"""
@@ -140,129 +232,22 @@ def CreateBorderGroups(init_mesh):
     bfaces = M.GetGroupByName('Boundary_Faces')[0]
     bfacesId = bfaces.GetListOfID()
 
-    # collect centroids and normals
-    bfaces_centroids = np.array([M.BaryCenter(f) for f in bfacesId])
-    bfaces_normals = np.array([M.GetFaceNormal(f, True) for f in bfacesId])
-
-    bfacesId = np.array(bfacesId, dtype=int)
-    box = M.GetBoundingBox()
+    # centroids and normals of the boundary faces (see MeshGeometry)
+    geom, bfacesId = BoundaryFaceIds(M, bfacesId)
 
-    # faces |_Ox
-    faces_mask = bfaces_centroids[:, 0] == box.minX
-    if np.sum(faces_mask) > 0:
-        gface_ymin = M.CreateEmptyGroup(SMESH.FACE, "Westside_Faces")
-        ii = list(np.unique(bfacesId[faces_mask]))
-        indexes = [int(i) for i in ii]
-        gface_ymin.Add(indexes)
-    else:
-        faces_mask = (bfaces_normals[:, 0] < 0) & (
-            np.argmax(np.abs(bfaces_normals), axis=1) == 0)
-        if np.sum(faces_mask) > 0:
-            gface_ymin = M.CreateEmptyGroup(SMESH.FACE, "Westside_Faces")
-            ii = list(np.unique(bfacesId[faces_mask]))
-            indexes = [int(i) for i in ii]
-            gface_ymin.Add(indexes)
-        else:
-            LOG.warning('Westside Faces not found')
-    gface_ymin.SetColorNumber(1)
-    gface_ymin.SetColor( SALOMEDS.Color( 1, 0, 0 ))
-
-    faces_mask = bfaces_centroids[:, 0] == box.maxX
-    if np.sum(faces_mask) > 0:
-        gface_ymax = M.CreateEmptyGroup(SMESH.FACE, "Eastside_Faces")
-        ii = list(np.unique(bfacesId[faces_mask]))
-        indexes = [int(i) for i in ii]
-        gface_ymax.Add(indexes)
-    else:
-        faces_mask = (bfaces_normals[:, 0] > 0) & (
-            np.argmax(np.abs(bfaces_normals), axis=1) == 0)
+    # faces |_Ox, |_Oy and |_Oz
+    sides = geom.boundary_sides()
+    for i, ((name, faces_mask), color) in enumerate(zip(sides, SIDE_COLORS)):
+        faces_mask = faces_mask & (bfacesId > 0)
         if np.sum(faces_mask) > 0:
-            gface_ymax = M.CreateEmptyGroup(SMESH.FACE, "Eastside_Faces")
+            gface = M.CreateEmptyGroup(SMESH.FACE, name + "_Faces")
             ii = list(np.unique(bfacesId[faces_mask]))
             indexes = [int(i) for i in ii]
-            gface_ymax.Add(indexes)
+            gface.Add(indexes)
+            gface.SetColorNumber(i + 1)
+            gface.SetColor(SALOMEDS.Color(*color))
         else:
-            LOG.warning('Eastside Faces not found')
-    gface_ymax.SetColorNumber(2)
-    gface_ymax.SetColor( SALOMEDS.Color(1, 1, 0))
-
-    # faces |_Oy
-    faces_mask = bfaces_centroids[:, 1] == box.minY
-    if np.sum(faces_mask) > 0:
-        gface_ymin = M.CreateEmptyGroup(SMESH.FACE, "Southside_Faces")
-        ii = list(np.unique(bfacesId[faces_mask]))
-        indexes = [int(i) for i in ii]
-        gface_ymin.Add(indexes)
-    else:
-        faces_mask = (bfaces_normals[:, 1] < 0) & (
-            np.argmax(np.abs(bfaces_normals), axis=1) == 1)
-        if np.sum(faces_mask) > 0:
-            gface_ymin = M.CreateEmptyGroup(SMESH.FACE, "Southside_Faces")
-            ii = list(np.unique(bfacesId[faces_mask]))
-            indexes = [int(i) for i in ii]
-            gface_ymin.Add(indexes)
-        else:
-            LOG.warning('Southside Faces not found')
-    gface_ymin.SetColorNumber(3)
-    gface_ymin.SetColor( SALOMEDS.Color(0, 1, 0))
-
-    faces_mask = bfaces_centroids[:, 1] == box.maxY
-    if np.sum(faces_mask) > 0:
-        gface_ymax = M.CreateEmptyGroup(SMESH.FACE, "Northside_Faces")
-        ii = list(np.unique(bfacesId[faces_mask]))
-        indexes = [int(i) for i in ii]
-        gface_ymax.Add(indexes)
-    else:
-        faces_mask = (bfaces_normals[:, 1] > 0) & (
-            np.argmax(np.abs(bfaces_normals), axis=1) == 1)
-        if np.sum(faces_mask) > 0:
-            gface_ymax = M.CreateEmptyGroup(SMESH.FACE, "Northside_Faces")
-            ii = list(np.unique(bfacesId[faces_mask]))
-            indexes = [int(i) for i in ii]
-            gface_ymax.Add(indexes)
-        else:
-            LOG.warning('Northside Faces not found')
-    gface_ymax.SetColorNumber(4)
-    gface_ymax.SetColor( SALOMEDS.Color(0, 1, 1))
-
-    # faces |_Oz
-    faces_mask = bfaces_centroids[:, -1] == box.minZ
-    if np.sum(faces_mask) > 0:
-        gface_zmin = M.CreateEmptyGroup(SMESH.FACE, "Bottomside_Faces")
-        ii = list(np.unique(bfacesId[faces_mask]))
-        indexes = [int(i) for i in ii]
-        gface_zmin.Add(indexes)
-    else:
-        faces_mask = (bfaces_normals[:, -1] < 0) & (
-            np.argmax(np.abs(bfaces_normals), axis=1) == 2)
-        if np.sum(faces_mask) > 0:
-            gface_zmin = M.CreateEmptyGroup(SMESH.FACE, "Bottomside_Faces")
-            ii = list(np.unique(bfacesId[faces_mask]))
-            indexes = [int(i) for i in ii]
-            gface_zmin.Add(indexes)
-        else:
-            LOG.warning('Bottomside Faces not found')
-    gface_zmin.SetColorNumber(5)
-    gface_zmin.SetColor( SALOMEDS.Color( 1, 0, 1))
-
-    faces_mask = bfaces_centroids[:, -1] == box.maxZ
-    if np.sum(faces_mask) > 0:
-        gface_zmax = M.CreateEmptyGroup(SMESH.FACE, "Topside_Faces")
-        ii = list(np.unique(bfacesId[faces_mask]))
-        indexes = [int(i) for i in ii]
-        gface_zmax.Add(indexes)
-    else:
-        faces_mask = (bfaces_normals[:, -1] > 0) & (
-            np.argmax(np.abs(bfaces_normals), axis=1) == 2)
-        if np.sum(faces_mask) > 0:
-            gface_zmax = M.CreateEmptyGroup(SMESH.FACE, "Topside_Faces")
-            ii = list(np.unique(bfacesId[faces_mask]))
-            indexes = [int(i) for i in ii]
-            gface_zmax.Add(indexes)
-        else:
-            LOG.warning('Topside Faces not found')
-    gface_zmax.SetColorNumber(6)
-    gface_zmax.SetColor( SALOMEDS.Color(0, 0, 1))
+            LOG.warning('%s Faces not found', name)
 
     LOG.info("Done!")
     return M
@@ -270,10 +255,11 @@ def CreateBorderGroups(init_mesh):
 
 # ------------------------------------------------------------------------------
 def CreateBorderGroupsFromRegions(mesh, regions, dx, group_name, only_one_bface=False):
-    """Create boundary groups on mesh object"""
+    """Create boundary groups on mesh object. regions are polygons (see
+    polygons.as_polygon, parts and holes included) or polylines: the boundary
+    faces inside a region or closer than max(dx) to its lines are grouped"""
     import SMESH
     import SALOMEDS
-    from matplotlib import path
 
     # check if mesh has 'Boundary_Faces' group
     groups = mesh.GetGroups()
@@ -295,11 +281,14 @@ def CreateBorderGroupsFromRegions(mesh, regions, dx, group_name, only_one_bface=
         bfaces = mesh.GetGroupByName('Boundary_Faces')[0]
 
     bfacesId = bfaces.GetListOfID()
-    nbfaces = len(bfacesId)
 
-    # collect centroids and normals
-    bfaces_centroids = np.array([mesh.BaryCenter(f) for f in bfacesId])
-    bfacesId = np.array(bfacesId, dtype=int)
+    # boundary face centroids and their (x, y) index, shared with the other
+    # macros on this mesh (see MeshGeometry)
+    geom, bfacesId = BoundaryFaceIds(mesh, bfacesId)
+    c, f = geom.boundary_faces
+    bfaces_centroids = geom.face_centroids[c, f]
+    index = geom.boundary_index
+    nbfaces = bfacesId.size
     ibfaces = np.arange(nbfaces)
     # msk = np.zeros((nbfaces,), dtype=bool)
     r = max(*dx)
@@ -307,28 +296,21 @@ def CreateBorderGroupsFromRegions(mesh, regions, dx, group_name, only_one_bface=
     # create color scales
     col = np.random.uniform(0,1,3*len(regions))
     for region in regions:
-        # make a path
-        p = path.Path(region)
-        msk = p.contains_points(bfaces_centroids[:, [0, 1]])
-        # mark regions closed to region conform criterio (dx, dy)
-        for p in region:
-            dist = np.sqrt(np.sum((p - bfaces_centroids[:,:-1])*(p - bfaces_centroids[:,:-1]),axis=1))
-            msk[dist < r] = True
+        # faces inside the region (indexed point in polygon)
+        region = polygons.as_polygon(region)
+        msk = region.contains(bfaces_centroids[:, [0, 1]])
+        # faces closer than the criterio (dx, dy) to the region lines
+        msk |= index.near_segments(*region.segments(), r)
+        msk &= bfacesId > 0
         # collect bfaces
         bfaces_marked = ibfaces[msk]
-        if only_one_bface: 
-            # mark only the face with maximum z-coordinate
-            for f in bfaces_marked:
-                if msk[f]:
-                    # mark faces with same x,y coordinates
-                    b = np.all(bfaces_centroids[f,:-1] == bfaces_centroids[:,:-1], axis=1)
-                    idx = ibfaces[b] # faces with same coordinates
-                    imx = np.argmax(bfaces_centroids[idx,-1]) # index of maximum z
-                    # unmark all
-                    msk[idx] = False
-                    # mark only bface at surface
-                    msk[idx[imx]] = True
-            bfaces_marked = ibfaces[msk]
+        if only_one_bface and bfaces_marked.size > 0:
+            # mark only the face with maximum z-coordinate among the marked
+            # faces with the same x,y coordinates (see grids.pillar_index)
+            _, _, _, top, _ = grids.pillar_index(
+                bfaces_centroids[bfaces_marked, :-1],
+                bfaces_centroids[bfaces_marked, -1])
+            bfaces_marked = np.sort(bfaces_marked[top])
         if len(bfaces_marked) > 0:
             LOG.info(f"Creating Group " + group_name + str(count))
             fgroup = mesh.CreateGroup(SMESH.FACE, group_name + str(count))
@@ -341,11 +323,20 @@ def CreateBorderGroupsFromRegions(mesh, regions, dx, group_name, only_one_bface=
 
 
 # ------------------------------------------------------------------------------
-def LoadFlowMeshNumpy(fname, min_thickness=5.0, auto_save=True):
+def LoadFlowMeshNumpy(fname, min_thickness=5.0, auto_save=True, scratch_dir=None,
+                      tol=1e-9, method='local'):
     """
     Load IMEX flow model, based on coordinate and connections files, smoothing
     all faults grid and removing pinchouts in the mesh adding a minimal
     thickness. Returns a tuple (a ndarray coordinate, ndarray connectivities)
+
+    With a scratch directory (see utilities.GetScratchDirectory) the new grid
+    is memory mapped, it can be reopened by utilities.open_scratch_mesh with
+    the name <basename of fname>_smoothed.
+
+    Nodes (and cells centroids) closer than tol in x and y are taken as the
+    same pillar. Top and base horizons are interpolated with method (see
+    horizons.METHODS, 'rbf' for the former dense scipy Rbf).
     """
 
     # %% procedures
@@ -391,11 +382,9 @@ def LoadFlowMeshNumpy(fname, min_thickness=5.0, auto_save=True):
 
     # compute cell centers and volume
     LOG.debug("Compute cell center and volume")
-    cells_centroids = np.zeros((n_c, n_d))
-    vol = np.zeros((n_c,))
-    for c in range(n_c):
-        cells_centroids[c, :] = np.mean(d_nodes[d_cells[c, :]-1, :], axis=0)
-        vol[c] = utils.volume_hexahedron(d_nodes[d_cells[c, :]-1, :])
+    geom = geometry.GridGeometry(d_nodes, d_cells - 1)
+    cells_centroids = geom.centroids
+    vol = geom.volumes
 
     L_x = np.max(nodes[:, 0]) - np.min(nodes[:, 0])
     L_y = np.max(nodes[:, 1]) - np.min(nodes[:, 1])
@@ -429,116 +418,36 @@ def LoadFlowMeshNumpy(fname, min_thickness=5.0, auto_save=True):
     tic = time.time()
     # -------------------------------------
     LOG.info('Counting pillars')
-    # counting pillars
-    idx = np.arange(0, n_n)
-    n_pillar_nodes = []
-    pillars_nodes = []
-    layer_n = np.zeros((n_n,))
-    pnodes = np.zeros((n_n,), dtype=bool)
-    for n in idx:
-        if pnodes[n]:
-            continue
-        pnodes[n] = True
-
-        # diff of nodes (same pillar has dx=dy=0)
-        dx = np.abs(nodes[n, :] - nodes[:, ])[:, 0:n_d-1]
-
-        # check for pillar
-        p = utils.find_indexes((dx[:, 0] < 1e-9) & (dx[:, 1] < 1e-9))
-        # print(dx)
-
-        if len(p) > 0:
-            pillars_nodes.append(p)
-            n_pillar_nodes.append(len(p))
-
-            zmin = np.argmin(nodes[p, -1])
-            zmax = np.argmax(nodes[p, -1])
-
-            layer_n[p[zmin]] = -1
-            layer_n[p[zmax]] = +1
-
-            pnodes[p] = True
+    # pillars are the nodes with the same x and y-coordinates
+    _, indptr, _, ntop, nbot = grids.pillar_index(nodes[:, 0:n_d-1],
+                                                  nodes[:, -1], tol)
+    n_pillar_nodes = np.diff(indptr)
 
     toc = time.time()
-    LOG.info(' number of pillars: %d', len(pillars_nodes))
+    LOG.info(' number of pillars: %d', n_pillar_nodes.size)
     LOG.info('Elapsed in %f seconds', toc-tic)
 
     # -------------------------------------
-    # mark top and bottom cells in pillars
+    # count cells in pillars
     LOG.info('Collecting pillars info')
     tic = time.time()
-    n_pillar = []
-    pillars = []
-    idx = np.arange(0, n_c)
-    cells = np.zeros((n_c,), dtype=bool)
+    pillar, indptr, cmembers, _, _ = grids.pillar_index(
+        cells_centroids[:, 0:n_d-1], cells_centroids[:, -1], tol)
+    cells_pillar = np.diff(indptr)[pillar]
+
+    # cell sizes, taken on the first cell of each pillar
+    first = cmembers[indptr[:-1]]
     dxyz = np.zeros((n_c, n_d))
-    for n in idx:
-        if cells[n]:
-            continue
-
-        cells[n] = True
-
-        # diff of nodes (same pillar has dx=dy=0)
-        dx = np.abs(cells_centroids[n, :] - cells_centroids[:, ])[:, 0:n_d-1]
-
-        dxyz[n, 0] = np.abs(nodes[d_cells[n, 0], 0] - nodes[d_cells[n, 1], 0])
-        dxyz[n, 1] = np.abs(nodes[d_cells[n, 0], 1] - nodes[d_cells[n, 2], 1])
-        dxyz[n, 2] = np.abs(nodes[d_cells[n, 0], 2] - nodes[d_cells[n, 3], 2])
-
-        # check for pillar
-        p = utils.find_indexes((dx[:, 0] < 1e-9) & (dx[:, 1] < 1e-9))
-        # print(dx)
-        if len(p) > 0:
-            pillars.append(p)
-            n_pillar.append(len(p))
-            cells[p] = True
-
-    # mark cells on top and bot
-    cells_pillar = np.zeros((n_c,))
-    nr_pillar = np.zeros((n_c,))
-    layer = np.zeros_like(nr_pillar)
-    i = 0
-    top, bot = 1, -1
-    for p in pillars:
-        i += 1
-        n = len(p)
-        cells_pillar[p] = n
-        nr_pillar[p] = i
-        zmin = np.argmin(cells_centroids[p, -1])
-        zmax = np.argmax(cells_centroids[p, -1])
-        layer[p[zmin]] = bot
-        layer[p[zmax]] = top
+    for d in range(n_d):
+        dxyz[first, d] = np.abs(nodes[d_cells[first, 0], d] -
+                                nodes[d_cells[first, d + 1], d])
 
     # -------------------------------------
     # nodes on top and bot
-    tnodes = np.zeros((len(pillars_nodes), n_d))
-    bnodes = np.zeros_like(tnodes)
-    for n in range(len(pillars_nodes)):
-        nodes_on_pillar = pillars_nodes[n]
-
-        if len(nodes_on_pillar) > 1:
-            # get nodes marked on top
-            idx = utils.find_indexes(layer_n[nodes_on_pillar] == top)
-            if len(idx) > 1:
-                tnodes[n, :] = np.mean(nodes[idx, :], axis=0)
-            else:
-                zmax = np.argmax(nodes[nodes_on_pillar, -1])
-                tnodes[n, :] = nodes[nodes_on_pillar[zmax], :]
-
-            # get nodes marked on bottom
-            idx = utils.find_indexes(layer_n[nodes_on_pillar] == bot)
-            if len(idx) > 1:
-                bnodes[n, :] = np.mean(nodes[idx, :], axis=0)
-            else:
-                zmin = np.argmin(nodes[nodes_on_pillar, -1])
-                bnodes[n, :] = nodes[nodes_on_pillar[zmin], :]
-        else:
-            LOG.warning('Pillar #%d with one node!!', n)
-            # get nodes marked on top
-            tnodes[n, :] = nodes[layer_n[nodes_on_pillar], :]
-
-            # get nodes marked on bottom
-            bnodes[n, :] = nodes[layer_n[nodes_on_pillar], :]
+    for n in utils.find_indexes(n_pillar_nodes == 1):
+        LOG.warning('Pillar #%d with one node!!', n)
+    tnodes = nodes[ntop, :]
+    bnodes = nodes[nbot, :]
     toc = time.time()
     LOG.info('Elapsed in %f seconds', toc-tic)
 
@@ -561,7 +470,8 @@ def LoadFlowMeshNumpy(fname, min_thickness=5.0, auto_save=True):
     n_z = np.int64(np.floor(np.mean(cells_pillar))) - 1
     z = np.linspace(0, n_z, np.int64(n_z)+1)
 
-    vertices = np.array([[i, j, k] for k in z for j in y for i in x])
+    vertices, conn = utils.CartGrid(x, y, z, scratch_dir=scratch_dir,
+                                    name=os.path.basename(fname) + '_smoothed')
     # mark top and bottom vertices
     mrk = np.zeros((vertices.shape[0]))
     mrk[utils.find_indexes(vertices[:, -1] == 0)] = -1
@@ -572,11 +482,11 @@ def LoadFlowMeshNumpy(fname, min_thickness=5.0, auto_save=True):
     # --------------------------------------
     # interpolation process
     tic = time.time()
-    ztop = inter.Rbf(tnodes[:, 0], tnodes[:, 1], tnodes[:, 2],
-                     function='linear', smooth=100)
+    ztop = horizons.Horizon(tnodes[:, 0], tnodes[:, 1], tnodes[:, 2],
+                            method=method, function='linear', smooth=100)
     vertices[mrk > 0, -1] = ztop(vertices[mrk > 0, 0], vertices[mrk > 0, 1])
-    zbot = inter.Rbf(bnodes[:, 0], bnodes[:, 1], bnodes[:, 2],
-                     function='linear', smooth=100)
+    zbot = horizons.Horizon(bnodes[:, 0], bnodes[:, 1], bnodes[:, 2],
+                            method=method, function='linear', smooth=100)
     vertices[mrk < 0, -1] = zbot(vertices[mrk < 0, 0], vertices[mrk < 0, 1])
 
     # # plot fitted points
@@ -588,61 +498,31 @@ def LoadFlowMeshNumpy(fname, min_thickness=5.0, auto_save=True):
     #            vertices[mrk < 0, 2], marker='.')
     # plt.show()
 
-    # remove pinch-outs (pillar with same nodes coordinate)
-    ncheck = np.zeros((vertices.shape[0],), dtype=bool)
+    # remove pinch-outs: the grid is structured, so the pillars are the
+    # columns of the (levels, nodes per level) view of the z-coordinates
     dz = np.mean(dxyz[dxyz[:, -1] > 0], axis=0)[-1]
     if min_thickness < 1e-9:
         min_thickness = dz
-    for i in range(vertices.shape[0]):
-        if ncheck[i]:
-            continue
-        ncheck[i] = True
-
-        # diff of nodes (same pillar has dx=dy=0)
-        dx = np.abs(vertices[i, :] - vertices[:, ])[:, 0:n_d-1]
-
-        # check for pillar (nodes in same x and y-coordinates)
-        p = np.array(utils.find_indexes((dx[:, 0] < 1e-9) & (dx[:, 1] < 1e-9)))
-        # print(dx)
-        if len(p) > 0:
-            marked = mrk[p]
-            # split internal and top/bot (marked) pillar nodes
-            unmarked = p[utils.find_indexes(marked == 0)]
-            marked = p[utils.find_indexes(marked != 0)]
-
-            # horizons
-            zmax = np.max(vertices[marked, -1])
-            zmin = np.min(vertices[marked, -1])
-
-            # sorted index (unmarked)
-            if np.abs(zmax-zmin) > dz:
-                # z = vertices[unmarked, -1]
-                # ind = np.unravel_index(np.argsort(z, axis=None), z.shape)[0]
-                z_linspace = np.linspace(zmin, zmax, len(p))
-                z_linspace = z_linspace[1:len(p)-1:1]
-                # for v in range(len(unmarked)):
-                #     z[ind[v]] = z_linspace[v]
-                # vertices[unmarked, -1] = z
-                vertices[unmarked, -1] = z_linspace
-            else:
-                marked = mrk[p]
-                # split internal and top (marked) pillar nodes
-                unmarked = p[utils.find_indexes(marked < 1)]
-                marked = p[utils.find_indexes(marked > 0)]
-
-                # boundary horizon
-                zmax = np.max(vertices[marked, -1])
-                # z = vertices[unmarked, -1]
-                # ind = np.unravel_index(np.argsort(z, axis=None), z.shape)[0]
-                z_linspace = np.linspace(zmax - len(p) * min_thickness, zmax,
-                                         len(p))
-                # z_linspace = z_linspace[1:]
-                # for v in range(len(unmarked)):
-                #     z[ind[v]] = z_linspace[v]
-                # vertices[unmarked, -1] = z
-                vertices[p, -1] = z_linspace
-
-        ncheck[p] = True
+    n_lev = np.int64(n_z) + 1
+    zv = vertices[:, -1].reshape(n_lev, -1)
+    zmax = np.maximum(zv[0], zv[-1])
+    zmin = np.minimum(zv[0], zv[-1])
+
+    # re-space internal nodes between the horizons
+    thick = np.abs(zmax - zmin) > dz
+    cols = np.flatnonzero(thick)
+    start = zmin[cols]
+    step = (zmax[cols] - start) / (n_lev - 1)
+    for k in range(1, n_lev - 1):
+        zv[k, cols] = k * step + start
+
+    # pinch-outs: minimal thickness below the top horizon
+    cols = np.flatnonzero(~thick)
+    zcap = zv[-1, cols]
+    start = zcap - n_lev * min_thickness
+    step = (zcap - start) / (n_lev - 1)
+    for k in range(n_lev - 1):
+        zv[k, cols] = k * step + start
 
     toc = time.time()
     LOG.info(' Vertices interp. elapsed in %f seconds', toc-tic)
@@ -658,40 +538,28 @@ def LoadFlowMeshNumpy(fname, min_thickness=5.0, auto_save=True):
     #            vertices[mrk == 0, 2], marker='.')
     # plt.show()
 
-    # create cell nodes --------------------------------------------------
-    tic = time.time()
+    # cell nodes were built along with the vertices (CartGrid) -----------
     nx = np.int64(n_x)
     ny = np.int64(n_y)
     nz = np.int64(n_z)
 
-    i, j, k = np.mgrid[0:nx, 0:ny, 0:nz]
-    ijk = np.ravel_multi_index(
-        [list(i.ravel()), list(j.ravel()), list(
-            k.ravel())], (nx + 1, ny + 1, nz + 1),
-        order='F')
-    conn = np.array([[i, i+1, i+1+(nx+1), i+(nx+1),
-                      i+(nx+1)*(ny+1), i+1+(nx+1) *
-                      (ny+1), i+1+(nx+1)+(nx+1)*(ny+1),
-                      i+(nx+1)+(nx+1)*(ny+1)]
-                     for i in ijk], dtype='uint64')
-    toc = time.time()
-    LOG.info(' Connections build elapsed in %f seconds', toc-tic)
-
     # compute cells volume
     LOG.info('Evaluating grid')
-    volumes = np.zeros(nx*ny*nz)
-    for c in range(nx*ny*nz):
-        volumes[c] = utils.volume_hexahedron(vertices[conn[c]])
+    volumes = geometry.GridGeometry(vertices, conn).volumes
 
     if any(volumes < 1e-9):
         LOG.warning('** Negative volume found!')
+    CheckMeshQuality(vertices, conn)
     LOG.info('Done')
 
     # create unv
     if auto_save:
-        utils.write_unv(fname + "_smoothed.unv", vertices, conn + 1)
+        utils.write_unv(fname + "_smoothed.unv", vertices, conn, offset=1)
         np.savetxt(fname + '_smoothed.coords', vertices)
-        np.savetxt(fname + '_smoothed.lnods', conn + 1, fmt='%10d')
+        step = max(1, utils.GetMemoryBudget() // 128)
+        with open(fname + '_smoothed.lnods', 'w') as lnods:
+            for c in range(0, conn.shape[0], step):
+                np.savetxt(lnods, conn[c:c + step] + 1, fmt='%10d')
 
     return (vertices, conn)
 
@@ -750,7 +618,8 @@ def SmeshFromNodesAndCellNodes(nodes, cells, make_groups=True):
 def CreateExtendedMesh(mesh, direction_key, length, division):
     """
     Create an extended grid from a given direction with dimensions and
-    divisions provided.
+    divisions provided. The nodes of the side must lie on a regular grid of
+    pillars (ValueError otherwise).
     """
 
     # Get direction code
@@ -817,105 +686,181 @@ def CreateExtendedMesh(mesh, direction_key, length, division):
                                xmean[2] + (5 - direction) * length,
                                division + 1)
 
-        axis = [0, 1]
-        pillars = [x_offset, y_offset]
         z_ref = (direction - 4) * z_offset[0] + (5 - direction) * z_offset[-1]
 
     # Generate side mesh
     LOG.debug("Creating grid extended")
     (nodes, cells) = utils.CartGrid(x_offset, y_offset, z_offset)
 
-    # for irregular sides (z extend)
+    # for irregular sides (z extend): the side grid nodes are the levels of
+    # its (x, y) pillars, vertices are located by sorted-key lookups
     LOG.debug("Aligning nodes")
+    n_lev = z_offset.size
+    z_nodes = nodes[:, 2].reshape(n_lev, y_offset.size, x_offset.size)
     if direction > 3:
-        # align/fit coordinates
-        for p0 in pillars[0]:
-            for p1 in pillars[1]:
-                # pillar in grid
-                i = utils.find_indexes((vertices[:, axis[0]] == p0) &
-                                       (vertices[:, axis[1]] == p1))
-                z = vertices[i][0]
-
-                # adjust z coords
-                j = np.array(utils.find_indexes((nodes[:, axis[0]] == p0)
-                                                & (nodes[:, axis[1]] == p1)))
-                dist = nodes[j, -1] - z[-1]
-                ind = np.argsort(dist)
-                nodes[j[ind], 2] = np.linspace(
-                    (direction - 4) * z_ref + (5 - direction) * z[-1],
-                    (direction - 4) * z[-1] + (5 - direction) * z_ref,
-                    division + 1)
+        # surface of the side, first vertex of each pillar
+        key = (np.searchsorted(y_offset, vertices[:, 1]) * x_offset.size +
+               np.searchsorted(x_offset, vertices[:, 0]))
+        key, first = np.unique(key, return_index=True)
+        if key.size != x_offset.size * y_offset.size:
+            raise ValueError('{} is not a rectangular grid'.format(side))
+        z = vertices[first, -1]
+
+        # adjust z coords
+        start = (direction - 4) * z_ref + (5 - direction) * z
+        stop = (direction - 4) * z + (5 - direction) * z_ref
+        step = (stop - start) / division
+        for k in range(division):
+            z_nodes[k] = (k * step + start).reshape(z_nodes.shape[1:])
+        z_nodes[-1] = stop.reshape(z_nodes.shape[1:])
 
     else:
-        # align/fit coordinates
-        for p in pillars:
-            # pillar in grid
-            i = utils.find_indexes(vertices[:, axis] == p)
-            z_pillar = np.sort(vertices[i, -1])
-
-            # adjust z coords
-            z = np.unique(nodes[nodes[:, axis] == p, -1])
-            for k in range(z.size):
-                j = utils.find_indexes((nodes[:, axis] == p)
-                                       & (nodes[:, 2] == z[k]))
-                nodes[j, 2] = z_pillar[k]
+        # sorted z of the vertices on each pillar
+        ip = np.searchsorted(pillars, vertices[:, axis])
+        order = np.lexsort((vertices[:, -1], ip))
+        count = np.bincount(ip, minlength=pillars.size)
+        if np.any(count < n_lev):
+            raise ValueError('{} is not a regular grid'.format(side))
+        offset = np.concatenate(([0], np.cumsum(count)[:-1]))
+        rank = np.arange(order.size) - np.repeat(offset, count)
+        z_pillar = np.empty((pillars.size, n_lev))
+        keep = rank < n_lev
+        z_pillar[ip[order[keep]], rank[keep]] = vertices[order[keep], -1]
+
+        # adjust z coords
+        if axis == 0:
+            z_nodes[...] = z_pillar.T[:, None, :]
+        else:
+            z_nodes[...] = z_pillar.T[:, :, None]
 
     # create SMESH
     return (nodes, cells)
 
 
 # ------------------------------------------------------------------------------
-def CreateMeshFromTopBase(vert, cells, fun_top, fun_base):
+def CreateMeshFromTopBase(vert, cells, fun_top, fun_base, check_quality=True,
+                          workers=None):
     """
-    Create grid from a given top and base function interpolated.
+    Create grid from a given top and base function interpolated. The quality
+    of the warped cells is logged unless check_quality is False (see
+    CheckMeshQuality). The vertices must stack on vertical pillars with the
+    same number of levels (see grids.column_levels for the spacing rules).
+    The top and base may be raster files (see horizons.read_raster), memory
+    mapped instead of fitted, or rasters sampled once beforehand (see
+    horizons.load_horizon with raster_size, cached, or
+    horizons.RasterHorizon.from_function); their max_deviation is logged. A
+    ValueError names the pillars where a horizon is not defined (NaN, e.g.
+    raster nodes without data). The functions are evaluated on tiles of
+    pillars, in parallel with more than one worker (see
+    parallel.evaluate_surface).
     """
-    top = vert[:, -1] == np.max(vert[:, -1])
-    base = vert[:, -1] == np.min(vert[:, -1])
-
-    # interpolate vertices top and base
-    vert[top, -1] = fun_top(vert[top, 0], vert[top, 1])
-    vert[base, -1] = fun_base(vert[base, 0], vert[base, 1])
-
-    vmsk = np.zeros((vert.shape[0],), dtype=bool)
-
-    # mark horizons (top and base)
-    horz = np.zeros((vert.shape[0],))
-    horz[top] = 1
-    horz[base] = -1
-    for i in range(vert.shape[0]):
-        if vmsk[i]:
-            continue
-        vmsk[i] = True
-
-        # diff of nodes (same pillar has dx=dy=0)
-        dx = np.abs(vert[i, :] - vert[:, ])[:, 0:2]
-
-        # check for pillar
-        msk = np.array(utils.find_indexes((dx[:, 0] < 1e-9) & (dx[:, 1] < 1e-9)))
-        hh = horz[msk]
-        top = np.argmax(hh)
-        base = np.argmin(hh)
-
-        if np.abs(vert[msk[0], -1] - vert[msk[-1], -1]) > 1e-9:
-            # sort
-            z_linspace = np.linspace(vert[msk[0], -1], vert[msk[-1], -1], len(msk))
-            vert[msk, -1] = z_linspace
-        else:
-            # sort
-            z_linspace = np.linspace(
-                vert[msk[0], -1] - 10, vert[msk[-1], -1] + 10, len(msk))
-            vert[msk, -1] = z_linspace
-        
-        # fix wrong data provided
-        if vert[msk[top],-1] < vert[msk[base],-1]:
-            vert[msk] = np.flipud(vert[msk])
-
-        vmsk[msk] = True
+    if isinstance(fun_top, str):
+        fun_top = horizons.read_raster(fun_top)
+    if isinstance(fun_base, str):
+        fun_base = horizons.read_raster(fun_base)
+    for name, fun in (('base', fun_base), ('top', fun_top)):
+        if getattr(fun, 'max_deviation', None) is not None:
+            LOG.info('%s horizon raster, max deviation %g', name,
+                     fun.max_deviation)
+
+    # group vertices by pillar, each column ordered from base to top
+    pillar, indptr, _, _, _ = grids.pillar_index(vert[:, 0:2], vert[:, -1])
+    n_lev = np.diff(indptr)
+    if n_lev.size == 0 or np.any(n_lev != n_lev[0]):
+        raise ValueError('vertices do not stack on pillars of the same size')
+    cols = np.lexsort((vert[:, -1], pillar)).reshape(n_lev.size, n_lev[0])
+
+    # interpolate top and base once per pillar, then re-space the columns
+    xp, yp = vert[cols[:, 0], 0], vert[cols[:, 0], 1]
+    nz = n_lev[0] - 1
+    zbase = parallel.evaluate_surface(fun_base, xp, yp, workers)
+    ztop = parallel.evaluate_surface(fun_top, xp, yp, workers)
+    for name, z in (('base', zbase), ('top', ztop)):
+        bad = np.flatnonzero(~np.isfinite(z))
+        if bad.size > 0:
+            # e.g. raster nodes without data (see horizons.RasterHorizon)
+            raise ValueError('{} horizon undefined at {} pillar(s), e.g. at (x, y) '
+                             '{}'.format(name, bad.size, np.column_stack(
+                                 (xp[bad[:5]], yp[bad[:5]])).tolist()))
+    vert[cols, -1] = grids.column_levels(zbase, ztop, np.arange(nz + 1), nz).T
+
+    if check_quality:
+        CheckMeshQuality(vert, cells)
 
     # create SMESH
     return SmeshFromNodesAndCellNodes(vert, cells + 1, False)
 
 
+# ------------------------------------------------------------------------------
+def CreateGridModelBySlabs(fname, limits, nx, ny, nz, fun_top=None,
+                           fun_base=None, axis='k', max_bytes=None):
+    """
+    Create a grid model constrained by limits (model area, polygons.Polygon or
+    (n, 2) vertices) between top and base horizons, writing it to a UNV file
+    slab by slab (k-layers or j-rows, see axis). Only column-wise (2D) arrays
+    are kept for the whole grid, so peak memory is bounded by max_bytes (see
+    utilities.GetMemoryBudget) instead of growing with the number of cells.
+    Returns the grids.StructuredGrid.
+    """
+
+    limits = polygons.as_polygon(limits)
+    xmin, ymin, xmax, ymax = limits.bbox
+    x = np.linspace(xmin, xmax, nx + 1)
+    y = np.linspace(ymin, ymax, ny + 1)
+    z = np.linspace(0, 1, nz + 1)
+    grid = grids.StructuredGrid(x, y, z)
+
+    tic = time.time()
+    LOG.info("Clipping grid columns")
+    grid.clip_columns(limits, max_bytes)
+
+    top = base = None
+    if fun_top is not None and fun_base is not None:
+        LOG.info("Sampling horizons")
+        top, base = grid.sample_horizons(fun_top, fun_base)
+
+    slabs = list(grid.iter_slabs(axis, max_bytes))
+    LOG.info("Writing %s in %d slab(s) along %s", fname, len(slabs), axis)
+    node_blocks = ((ids + 1, nodes) for ids, nodes in
+                   (grid.slab_nodes(axis, a, b, top, base) for a, b in slabs))
+    cell_blocks = ((grid.slab_cells(axis, a, b) + 1, None) for a, b in slabs)
+    utils.write_unv_blocks(fname, node_blocks, cell_blocks)
+    LOG.info('Elapsed in %f seconds', time.time() - tic)
+
+    return grid
+
+
+# ------------------------------------------------------------------------------
+def CreateStratigraphicModel(fname, limits, nx, ny, horizons, layers,
+                             min_thickness=0.0):
+    """
+    Create a multi-unit grid model constrained by limits (model area) between
+    N horizons (functions of x, y ordered from the base to the top) with the
+    given number of layers per unit, and write it to a UNV file with one region
+    (material) per unit. Horizons are evaluated once per pillar, see
+    grids.stratigraphic_grid. Returns a tuple (grids.PillarGrid, materials).
+    """
+
+    limits = polygons.as_polygon(limits)
+    xmin, ymin, xmax, ymax = limits.bbox
+    x = np.linspace(xmin, xmax, nx + 1)
+    y = np.linspace(ymin, ymax, ny + 1)
+    footprint = grids.StructuredGrid(x, y, [0, 1])
+
+    tic = time.time()
+    LOG.info("Clipping grid columns")
+    footprint.clip_columns(limits)
+
+    LOG.info("Building %d unit(s) between %d horizons", len(layers), len(horizons))
+    grid, mat = grids.stratigraphic_grid(footprint, horizons, layers, min_thickness)
+    nodes, cells = grid.to_hex()
+    CheckMeshQuality(nodes, cells)
+    utils.write_unv(fname, nodes, cells, mat, offset=1)
+    LOG.info('Elapsed in %f seconds', time.time() - tic)
+
+    return grid, mat
+
+
 # ------------------------------------------------------------------------------
 def CreatePolylinesFromShapefile(shape_file: str, closed: bool=True) -> None:
     """
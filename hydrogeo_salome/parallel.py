@@ -0,0 +1,261 @@
+# Copyright (C) 2017-2020 JCT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author : Jonathan Teixeira (jonathan.teixeira@ufpe.br)
+#
+
+
+"""
+This file contains the parallel (multi-process) execution of the geometry
+kernels over blocks of cells and of surfaces z = f(x, y) over tiles of points.
+Inputs and results are placed in shared memory (multiprocessing.shared_memory)
+once, the workers attach to them and only the block ranges are sent to the
+pool (no Salome dependencies)
+"""
+
+# plugin imports
+from . import utilities as utils
+from . import quality
+
+# python imports
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+
+
+# ------------------------------------------------------------------------------
+# geometry kernels: (nodes, cells block) -> tuple of arrays per cell
+def _centroids(nodes, cells):
+    return (np.mean(nodes[cells], axis=1),)
+
+
+def _volumes(nodes, cells):
+    return (utils.volume_hexahedra(nodes[cells])[1],)
+
+
+def _quality(nodes, cells):
+    metrics = quality.cell_quality(nodes, cells)
+    return tuple(metrics[m] for m in quality.METRICS)
+
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# Local CONST.
+# kernels: function and (name, shape per cell) of its outputs
+KERNELS = {
+    'centroids': (_centroids, (('centroids', (3,)),)),
+    'volumes': (_volumes, (('volumes', ()),)),
+    'quality': (_quality, tuple((m, ()) for m in quality.METRICS)),
+}
+# arrays attached by a worker process: name -> (shared memory, ndarray)
+_SHARED = {}
+# surface evaluated by a worker process (sent once, by the pool initializer)
+_SURFACE = {}
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+
+def _attach(name):
+    """attach to an existing shared memory block. Pool workers share the
+    resource tracker of the parent process, that owns and unlinks the block"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 (no track argument)
+        return shared_memory.SharedMemory(name=name)
+
+
+def _init_worker(descriptors):
+    """pool initializer: map the shared arrays (name, shm name, shape, dtype)"""
+    _SHARED.clear()
+    for name, shm_name, shape, dtype in descriptors:
+        shm = _attach(shm_name)
+        _SHARED[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+
+def _run_block(kernel, start, stop):
+    """worker: run the kernel on the cells [start, stop) and write the outputs"""
+    fun, outputs = KERNELS[kernel]
+    nodes, cells = _SHARED['nodes'][1], _SHARED['cells'][1]
+    for (name, _), values in zip(outputs, fun(nodes, cells[start:stop])):
+        _SHARED[name][1][start:stop] = values
+    return stop - start
+
+
+class SharedArrays(object):
+    """
+    Context manager that owns shared memory copies of arrays (dict name ->
+    ndarray) and empty output arrays (dict name -> (shape, dtype)); blocks are
+    released and unlinked on exit.
+    """
+
+    def __init__(self, inputs, outputs):
+        self.blocks = []
+        self.arrays = {}
+        self.descriptors = []
+        try:
+            for name, array in inputs.items():
+                array = np.asarray(array)
+                self._create(name, array.shape, array.dtype)[...] = array
+            for name, (shape, dtype) in outputs.items():
+                self._create(name, shape, dtype)
+        except BaseException:
+            self.close()
+            raise
+
+    def _create(self, name, shape, dtype):
+        dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * dtype.itemsize)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        self.blocks.append(shm)
+        self.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.descriptors.append((name, shm.name, shape, dtype.str))
+        return self.arrays[name]
+
+    def close(self):
+        self.arrays.clear()
+        for shm in self.blocks:
+            shm.close()
+            shm.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# ------------------------------------------------------------------------------
+def run_cell_kernel(kernel, nodes, cells, workers=None, chunk_size=1 << 16):
+    """
+    Run a geometry kernel (see KERNELS: 'centroids', 'volumes', 'quality') on
+    all the cells, split in blocks of chunk_size cells. With more than one
+    worker (see utilities.GetNumWorkers) the blocks run in a process pool
+    attached to shared memory copies of nodes and cells. Returns a dict of
+    arrays (output name -> values per cell), the same for any worker count.
+    """
+    fun, outputs = KERNELS[kernel]
+    nodes = np.asarray(nodes, dtype=np.float64)
+    cells = np.asarray(cells)
+    n = cells.shape[0]
+    ranges = [(kernel, a, min(a + chunk_size, n)) for a in range(0, n, chunk_size)]
+    workers = min(utils.GetNumWorkers(workers), max(1, len(ranges)))
+
+    if workers == 1:
+        result = {name: np.empty((n,) + shape) for name, shape in outputs}
+        for _, a, b in ranges:
+            for (name, _), values in zip(outputs, fun(nodes, cells[a:b])):
+                result[name][a:b] = values
+        return result
+
+    spec = {name: ((n,) + shape, np.float64) for name, shape in outputs}
+    with SharedArrays({'nodes': nodes, 'cells': cells}, spec) as shared:
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(shared.descriptors,)) as pool:
+            pool.starmap(_run_block, ranges)
+        return {name: shared.arrays[name].copy() for name, _ in outputs}
+
+
+def cell_centroids(nodes, cells, workers=None):
+    """cell centroids (n_cells, 3), mean of the 8 corners"""
+    return run_cell_kernel('centroids', nodes, cells, workers)['centroids']
+
+
+def cell_volumes(nodes, cells, workers=None):
+    """cell volumes (n_cells,), see utilities.volume_hexahedra"""
+    return run_cell_kernel('volumes', nodes, cells, workers)['volumes']
+
+
+def cell_quality(nodes, cells, workers=None):
+    """cell quality metrics, see quality.cell_quality"""
+    return run_cell_kernel('quality', nodes, cells, workers)
+
+
+# ------------------------------------------------------------------------------
+def _init_surface_worker(descriptors, fun):
+    """pool initializer: map the shared arrays and keep the surface function"""
+    _init_worker(descriptors)
+    _SURFACE['fun'] = fun
+
+
+def _run_tile(start, stop):
+    """worker: evaluate the surface on the tiled points [start, stop)"""
+    idx = _SHARED['order'][1][start:stop]
+    xy = _SHARED['xy'][1][idx]
+    _SHARED['z'][1][idx] = _SURFACE['fun'](xy[:, 0], xy[:, 1])
+    return stop - start
+
+
+def tile_order(x, y, tile_size=1 << 15):
+    """
+    Order of the points (x, y) grouped in square tiles of about tile_size
+    points (row of tiles, then column), so that consecutive blocks of
+    tile_size points are spatially coherent.
+    """
+    n = x.size
+    if n == 0:
+        return np.zeros((0,), dtype=np.int64)
+    lo = np.array([x.min(), y.min()])
+    extent = np.array([x.max(), y.max()]) - lo
+    frac = min(tile_size, n) / n
+    if np.all(extent > 0):
+        side = np.sqrt(extent[0] * extent[1] * frac)
+    else:
+        # points on a line (or a single point)
+        side = extent.max() * frac or 1.0
+    ix = ((x - lo[0]) / side).astype(np.int64)
+    iy = ((y - lo[1]) / side).astype(np.int64)
+    return np.lexsort((ix, iy))
+
+
+def evaluate_surface(fun, x, y, workers=None, tile_size=1 << 15):
+    """
+    Evaluate a surface fun(x, y) (e.g. a fitted horizon, see horizons.py) on
+    tiles of tile_size spatially close points (see tile_order). With more than
+    one worker (see utilities.GetNumWorkers) the tiles run in a process pool:
+    fun is sent once to each worker (it must be picklable where processes are
+    spawned) and the points and results are in shared memory. Returns z with
+    the broadcast shape of x and y, the same for any worker count.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    shape = np.broadcast(x, y).shape
+    xy = np.column_stack((np.broadcast_to(x, shape).ravel(),
+                          np.broadcast_to(y, shape).ravel()))
+    n = xy.shape[0]
+    order = tile_order(xy[:, 0], xy[:, 1], tile_size)
+    ranges = [(a, min(a + tile_size, n)) for a in range(0, n, tile_size)]
+    workers = min(utils.GetNumWorkers(workers), max(1, len(ranges)))
+
+    if workers == 1:
+        z = np.empty((n,))
+        for a, b in ranges:
+            idx = order[a:b]
+            z[idx] = fun(xy[idx, 0], xy[idx, 1])
+        return z.reshape(shape)
+
+    with SharedArrays({'xy': xy, 'order': order},
+                      {'z': ((n,), np.float64)}) as shared:
+        with multiprocessing.Pool(workers, initializer=_init_surface_worker,
+                                  initargs=(shared.descriptors, fun)) as pool:
+            pool.starmap(_run_tile, ranges)
+        return shared.arrays['z'].copy().reshape(shape)
@@ -0,0 +1,202 @@
+# Copyright (C) 2017-2020 JCT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author : Jonathan Teixeira (jonathan.teixeira@ufpe.br)
+#
+
+
+"""
+This file contains a point in polygon engine for multi-part polygons with
+holes, indexed by buckets of edges (no Salome dependencies)
+"""
+
+# plugin imports
+from . import utilities as utils
+
+# python imports
+import numpy as np
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# Local CONST.
+# mean number of edges per y-band of the edge buckets
+EDGES_PER_BAND = 8
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+
+class Polygon(object):
+    """
+    Polygon made of rings ((n, 2) vertices, closed from the last vertex to the
+    first): the parts and holes of a shape, or of several shapes. A point is
+    inside when a ray from it crosses the rings an odd number of times
+    (even-odd rule, so holes need no orientation), with the crossing rule of
+    matplotlib.path.Path.contains_points. The edges are bucketed in y-bands,
+    so after a bounding box test every point is only tested against the
+    edges of its band.
+    """
+
+    def __init__(self, rings, n_bands=None):
+        self.rings = [np.asarray(r, dtype=np.float64).reshape(-1, 2)
+                      for r in rings]
+        if self.rings:
+            pts = np.concatenate(self.rings)
+        else:
+            pts = np.zeros((0, 2))
+        if pts.shape[0] > 0:
+            self.bbox = np.concatenate((pts.min(axis=0), pts.max(axis=0)))
+        else:
+            self.bbox = np.array([np.inf, np.inf, -np.inf, -np.inf])
+
+        # edges (vtx0 -> vtx1) crossed by horizontal rays, horizontal ones
+        # never are
+        x0, y0 = pts[:, 0], pts[:, 1]
+        x1 = np.concatenate([np.roll(r[:, 0], -1) for r in self.rings] or [x0])
+        y1 = np.concatenate([np.roll(r[:, 1], -1) for r in self.rings] or [y0])
+        keep = y0 != y1
+        self.edges = np.stack((x0[keep], y0[keep], x1[keep], y1[keep]), axis=1)
+        self._bucket_edges(n_bands)
+
+    @property
+    def n_edges(self):
+        return self.edges.shape[0]
+
+    @property
+    def points(self):
+        """vertices of all the rings (n, 2)"""
+        if not self.rings:
+            return np.zeros((0, 2))
+        return np.concatenate(self.rings)
+
+    def segments(self):
+        """
+        Segments (a, b) along the rings, for distance tests: a ring is closed
+        only when its last vertex repeats the first (as in shapefiles), so
+        open polylines (e.g. read from xyz files) get no closing segment. A
+        single vertex is a segment of zero length.
+        """
+        a, b = [], []
+        for r in self.rings:
+            if r.shape[0] == 1:
+                a.append(r)
+                b.append(r)
+            else:
+                a.append(r[:-1])
+                b.append(r[1:])
+        if not a:
+            return np.zeros((0, 2)), np.zeros((0, 2))
+        return np.concatenate(a), np.concatenate(b)
+
+    def _band(self, y):
+        b = np.floor((y - self.bbox[1]) / self._height).astype(np.int64)
+        return np.clip(b, 0, self.n_bands - 1)
+
+    def _bucket_edges(self, n_bands):
+        """edges of every y-band (CSR: band b has edges
+        band_edges[band_ptr[b]:band_ptr[b + 1]])"""
+        if n_bands is None:
+            n_bands = self.n_edges // EDGES_PER_BAND
+        self.n_bands = max(int(n_bands), 1)
+        height = (self.bbox[3] - self.bbox[1]) / self.n_bands
+        self._height = height if height > 0 else 1.0
+        ey = self.edges[:, [1, 3]]
+        lo, hi = self._band(ey.min(axis=1)), self._band(ey.max(axis=1))
+        count = hi - lo + 1
+        edge = np.repeat(np.arange(self.n_edges), count)
+        band = np.repeat(lo, count) + (np.arange(edge.size) -
+                                       np.repeat(np.cumsum(count) - count, count))
+        order = np.argsort(band, kind='stable')
+        self.band_edges = edge[order]
+        self.band_ptr = np.zeros((self.n_bands + 1,), dtype=np.int64)
+        np.cumsum(np.bincount(band, minlength=self.n_bands),
+                  out=self.band_ptr[1:])
+
+    def contains(self, points, max_bytes=None):
+        """mask of the points (m, 2) inside the polygon"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        mask = np.zeros((points.shape[0],), dtype=bool)
+        xmin, ymin, xmax, ymax = self.bbox
+        cand = np.flatnonzero((points[:, 0] >= xmin) & (points[:, 0] <= xmax) &
+                              (points[:, 1] >= ymin) & (points[:, 1] <= ymax))
+        if cand.size == 0 or self.n_edges == 0:
+            return mask
+
+        # candidates sorted by band, in blocks of a bounded number of pairs
+        band = self._band(points[cand, 1])
+        order = np.argsort(band, kind='stable')
+        cand, band = cand[order], band[order]
+        count = self.band_ptr[band + 1] - self.band_ptr[band]
+        pairs = max(1, utils.GetMemoryBudget(max_bytes) // 128)
+        bounds = np.searchsorted(np.cumsum(count),
+                                 np.arange(pairs, count.sum(), pairs))
+        for q in np.split(np.arange(cand.size), np.unique(bounds) + 1):
+            if q.size == 0:
+                continue
+            c = count[q]
+            query = np.repeat(q, c)
+            rank = np.arange(query.size) - np.repeat(np.cumsum(c) - c, c)
+            e = self.edges[self.band_edges[np.repeat(self.band_ptr[band[q]], c)
+                                           + rank]]
+            tx, ty = points[cand[query], 0], points[cand[query], 1]
+            vx0, vy0, vx1, vy1 = e[:, 0], e[:, 1], e[:, 2], e[:, 3]
+            yflag0, yflag1 = vy0 >= ty, vy1 >= ty
+            crosses = (yflag0 != yflag1) & (
+                ((vy1 - ty) * (vx0 - vx1) >= (vx1 - tx) * (vy0 - vy1)) == yflag1)
+            parity = np.bincount(query - q[0], weights=crosses,
+                                 minlength=q.size)
+            mask[cand[q]] = parity % 2 == 1
+        return mask
+
+    def contains_grid(self, xc, yc, max_bytes=None):
+        """mask (nx, ny) of the points (xc[i], yc[j]) inside the polygon, by
+        scanlines (see utilities.scanline_mask)"""
+        return utils.scanline_mask(xc, yc, self, max_bytes)
+
+
+# ------------------------------------------------------------------------------
+def as_polygon(polygon):
+    """Polygon of a Polygon, of (n, 2) vertices or of a list of rings"""
+    if isinstance(polygon, Polygon):
+        return polygon
+    if isinstance(polygon, np.ndarray) or np.ndim(polygon[0]) == 1:
+        return Polygon([polygon])
+    return Polygon(polygon)
+
+
+def shape_rings(shape):
+    """rings (parts and holes) of a pyshp shape"""
+    pts = np.asarray(shape.points, dtype=np.float64).reshape(-1, 2)
+    parts = list(shape.parts) + [pts.shape[0]]
+    return [pts[parts[i]:parts[i + 1]] for i in range(len(parts) - 1)]
+
+
+def read_shapefile(fname, index=None):
+    """
+    Polygon of the shapes of a shapefile (all of them, or the shape index),
+    with all their parts and holes
+    """
+    import shapefile # pyshp
+    sf = shapefile.Reader(fname)
+    shapes = sf.shapes() if index is None else [sf.shape(index)]
+    rings = []
+    for shp in shapes:
+        rings.extend(shape_rings(shp))
+    return Polygon(rings)
@@ -0,0 +1,139 @@
+# Copyright (C) 2017-2020 JCT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author : Jonathan Teixeira (jonathan.teixeira@ufpe.br)
+#
+
+
+"""
+This file contains the quality metrics of hexahedral meshes computed in batch
+(no Salome dependencies)
+"""
+
+# python imports
+import numpy as np
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# Local CONST.
+# neighbours of every corner along x, y and z (corners ordered as in CartGrid)
+HEXA_NEIGHBOURS = np.array([[1, 3, 4], [0, 2, 5], [3, 1, 6], [2, 0, 7],
+                            [5, 7, 0], [4, 6, 1], [7, 5, 2], [6, 4, 3]])
+# +1 when the neighbour is on the positive side of the reference direction
+HEXA_SIGNS = np.array([[+1, +1, +1], [-1, +1, +1], [-1, -1, +1], [+1, -1, +1],
+                       [+1, +1, -1], [-1, +1, -1], [-1, -1, -1], [+1, -1, -1]])
+# metrics of cell_quality
+METRICS = ('min_jacobian', 'max_jacobian', 'scaled_jacobian', 'aspect_ratio',
+           'skewness', 'thickness')
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+
+def cell_quality(nodes, cells, block=4096):
+    """
+    Quality of hexahedral cells (corners ordered as in CartGrid), computed in
+    blocks of cells. Returns a dict of arrays (n_cells,):
+
+    min_jacobian, max_jacobian: determinants of the jacobian matrices at the
+      corners (edge vectors), not positive for inverted or collapsed corners;
+    scaled_jacobian: minimum at the corners of the determinant of the unit
+      edge vectors, 1 for a box and -1 for a fully inverted corner;
+    aspect_ratio: longest / shortest edge (inf with collapsed edges);
+    skewness: maximum |cos| between the principal axes, 0 for a box;
+    thickness: minimum z difference between the top and bottom corners (4-7
+      and 0-3), close to 0 at pinch-outs and negative for flipped cells.
+    """
+    nodes = np.asarray(nodes, dtype=np.float64)
+    cells = np.asarray(cells)
+    n = cells.shape[0]
+    out = {m: np.empty((n,)) for m in METRICS}
+    for c in range(0, n, block):
+        x = nodes[cells[c:c + block]]
+        for m, values in _block_quality(x).items():
+            out[m][c:c + block] = values
+    return out
+
+
+def _block_quality(x):
+    """metrics (see cell_quality) of hexahedra given by their corners (n, 8, 3)"""
+    # components of the edge vectors from every corner along the reference
+    # directions e[k, corner, direction, cell] (cells last, contiguous)
+    x = np.ascontiguousarray(x.transpose(2, 1, 0))
+    e = x[:, HEXA_NEIGHBOURS] - x[:, :, None]
+    e *= HEXA_SIGNS[None, :, :, None]
+    det = (e[0, :, 0] * (e[1, :, 1] * e[2, :, 2] - e[2, :, 1] * e[1, :, 2]) -
+           e[0, :, 1] * (e[1, :, 0] * e[2, :, 2] - e[2, :, 0] * e[1, :, 2]) +
+           e[0, :, 2] * (e[1, :, 0] * e[2, :, 1] - e[2, :, 0] * e[1, :, 1]))
+    length = np.sqrt(e[0] ** 2 + e[1] ** 2 + e[2] ** 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaled = det / np.prod(length, axis=1)
+        # every edge is seen from its 2 corners
+        aspect = length.max(axis=(0, 1)) / length.min(axis=(0, 1))
+    scaled[~np.isfinite(scaled)] = 0.
+    aspect[np.isnan(aspect)] = np.inf
+
+    # principal axes (sum of the 4 edges along each direction)
+    axes = 0.5 * e.sum(axis=1)
+    norm = np.sqrt(np.sum(axes ** 2, axis=0))
+    axes = np.divide(axes, norm, out=np.zeros(axes.shape), where=norm > 0)
+    cos = np.abs(np.stack((np.sum(axes[:, 0] * axes[:, 1], axis=0),
+                           np.sum(axes[:, 0] * axes[:, 2], axis=0),
+                           np.sum(axes[:, 1] * axes[:, 2], axis=0))))
+
+    return {'min_jacobian': det.min(axis=0),
+            'max_jacobian': det.max(axis=0),
+            'scaled_jacobian': scaled.min(axis=0),
+            'aspect_ratio': aspect,
+            'skewness': cos.max(axis=0),
+            'thickness': np.min(x[2, 4:] - x[2, :4], axis=0)}
+
+
+# ------------------------------------------------------------------------------
+def quality_summary(quality, bins=10):
+    """
+    Summary of cell_quality: for every metric a dict with min, max, mean and
+    the histogram (counts, bin edges) of its finite values, plus the number of
+    inverted cells (min_jacobian <= 0).
+    """
+    summary = {'n_cells': int(quality['min_jacobian'].size),
+               'inverted': int(np.count_nonzero(quality['min_jacobian'] <= 0))}
+    for m in METRICS:
+        values = quality[m][np.isfinite(quality[m])]
+        if values.size == 0:
+            summary[m] = {'min': np.nan, 'max': np.nan, 'mean': np.nan,
+                          'histogram': (np.zeros((bins,), dtype=np.int64),
+                                        np.zeros((bins + 1,)))}
+            continue
+        summary[m] = {'min': values.min(), 'max': values.max(),
+                      'mean': values.mean(),
+                      'histogram': np.histogram(values, bins=bins)}
+    return summary
+
+
+def format_summary(summary):
+    """text table of quality_summary (one line per metric)"""
+    lines = ['cells: {}, inverted: {}'.format(summary['n_cells'], summary['inverted']),
+             '{:>16s} {:>14s} {:>14s} {:>14s}'.format('metric', 'min', 'mean', 'max')]
+    for m in METRICS:
+        s = summary[m]
+        lines.append('{:>16s} {:14.6g} {:14.6g} {:14.6g}'.format(
+            m, s['min'], s['mean'], s['max']))
+    return '\n'.join(lines)
@@ -0,0 +1,263 @@
+# Copyright (C) 2017-2020 JCT
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Author : Jonathan Teixeira (jonathan.teixeira@ufpe.br)
+#
+
+
+"""
+This file contains a spatial index of points for tolerance (radius) and
+nearest point queries (no Salome dependencies)
+"""
+
+# python imports
+import itertools
+import numpy as np
+
+# optional: without scipy the index falls back to uniform bins
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+# Local CONST.
+# mean number of points per bin of the uniform-bin index
+POINTS_PER_BIN = 4
+# segment samples queried at once by near_segments
+SAMPLES_PER_BLOCK = 1 << 16
+# ------------------------------------------------------------------------------
+# ------------------------------------------------------------------------------
+
+
+class SpatialIndex(object):
+    """
+    Spatial index of points (n, d) built once and queried many times: points
+    within a radius (strictly closer than r, the same test of the brute force
+    dist < r) and nearest points. Uses scipy.spatial.cKDTree, or a hash of
+    uniform bins (backend='bins', the default without scipy).
+    """
+
+    def __init__(self, points, backend=None, cell_size=None, leafsize=16):
+        self.points = np.ascontiguousarray(points, dtype=np.float64)
+        if self.points.ndim != 2:
+            raise ValueError('points must be a (n, d) array')
+        if backend is None:
+            backend = 'bins' if cKDTree is None else 'kdtree'
+        if backend == 'kdtree':
+            if cKDTree is None:
+                raise ValueError('kdtree backend needs scipy')
+            self._tree = cKDTree(self.points, leafsize=leafsize)
+        elif backend == 'bins':
+            self._tree = _BinIndex(self.points, cell_size)
+        else:
+            raise ValueError('unknown backend: {}'.format(backend))
+        self.backend = backend
+
+    @property
+    def n_points(self):
+        return self.points.shape[0]
+
+    def _as_queries(self, points):
+        points = np.asarray(points, dtype=np.float64)
+        return points.reshape((-1, self.points.shape[1]))
+
+    def query_radius(self, points, r):
+        """
+        Indexed points closer than r to each query point. Returns a tuple
+        (indptr, indices): the neighbours of query q are
+        indices[indptr[q]:indptr[q + 1]], in ascending order.
+        """
+        points = self._as_queries(points)
+        if self.backend == 'kdtree':
+            hits = self._tree.query_ball_point(points, r, return_sorted=False)
+            count = np.fromiter((len(h) for h in hits), dtype=np.int64,
+                                count=len(hits))
+            cand = np.fromiter(itertools.chain.from_iterable(hits),
+                               dtype=np.int64, count=count.sum())
+            query = np.repeat(np.arange(points.shape[0]), count)
+        else:
+            query, cand = self._tree.candidates(points, r)
+
+        # exact test (and order) of the candidate pairs
+        d = points[query] - self.points[cand]
+        keep = np.sqrt(np.sum(d * d, axis=1)) < r
+        query, cand = query[keep], cand[keep]
+        order = np.lexsort((cand, query))
+        indptr = np.zeros((points.shape[0] + 1,), dtype=np.int64)
+        np.cumsum(np.bincount(query, minlength=points.shape[0]), out=indptr[1:])
+        return indptr, cand[order]
+
+    def near(self, points, r):
+        """mask of the indexed points closer than r to any query point"""
+        mask = np.zeros((self.n_points,), dtype=bool)
+        mask[self.query_radius(points, r)[1]] = True
+        return mask
+
+    def near_segments(self, a, b, r):
+        """
+        mask of the indexed points closer than r to any segment a[s] -> b[s]
+        (point to segment distance). The segments are sampled every r and
+        only the points near the samples are tested exactly, so the cost
+        depends on the points along the segments, not on all the points.
+        """
+        a, b = self._as_queries(a), self._as_queries(b)
+        mask = np.zeros((self.n_points,), dtype=bool)
+        if a.shape[0] == 0 or self.n_points == 0 or r <= 0:
+            return mask
+
+        # samples (both ends included) at most r apart along every segment
+        ab = b - a
+        length = np.sqrt(np.sum(ab * ab, axis=1))
+        n = np.ceil(length / r).astype(np.int64) + 1
+        seg = np.repeat(np.arange(a.shape[0]), n)
+        rank = np.arange(seg.size) - np.repeat(np.cumsum(n) - n, n)
+        t = rank / np.maximum(n[seg] - 1, 1)
+        samples = a[seg] + t[:, None] * ab[seg]
+
+        # a point closer than r to a segment is closer than sqrt(r^2 + (r/2)^2)
+        # to its nearest sample
+        den = np.sum(ab * ab, axis=1)
+        den[den == 0] = 1.0
+        for c in range(0, seg.size, SAMPLES_PER_BLOCK):
+            indptr, cand = self.query_radius(samples[c:c + SAMPLES_PER_BLOCK],
+                                             r * np.sqrt(1.25))
+            s = seg[c:c + SAMPLES_PER_BLOCK][np.repeat(np.arange(indptr.size - 1),
+                                                       np.diff(indptr))]
+            d = self.points[cand] - a[s]
+            t = np.clip(np.sum(d * ab[s], axis=1) / den[s], 0, 1)
+            d -= t[:, None] * ab[s]
+            mask[cand[np.sqrt(np.sum(d * d, axis=1)) < r]] = True
+        return mask
+
+    def nearest(self, points):
+        """
+        Nearest indexed point of each query point. Returns a tuple (ndarray
+        distances, ndarray indices); ties are broken arbitrarily.
+        """
+        points = self._as_queries(points)
+        if self.backend == 'kdtree':
+            dist, idx = self._tree.query(points, k=1)
+            return dist, idx.astype(np.int64)
+        return self._tree.nearest(points)
+
+
+class _BinIndex(object):
+    """points hashed in uniform bins (sorted bin keys)"""
+
+    def __init__(self, points, cell_size=None):
+        self.points = points
+        n, dim = points.shape
+        self.lo = points.min(axis=0) if n > 0 else np.zeros((dim,))
+        extent = (points.max(axis=0) - self.lo) if n > 0 else np.zeros((dim,))
+        if cell_size is None:
+            # about POINTS_PER_BIN points per bin over the non-flat axes
+            wide = extent[extent > 0]
+            if wide.size == 0:
+                cell_size = 1.0
+            else:
+                cell_size = (np.prod(wide) * POINTS_PER_BIN /
+                             max(n, 1)) ** (1.0 / wide.size)
+        self.cell = float(cell_size)
+        self.shape = np.floor(extent / self.cell).astype(np.int64) + 1
+        keys = self._keys(self._bins(points))
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def _bins(self, points):
+        return np.floor((points - self.lo) / self.cell).astype(np.int64)
+
+    def _keys(self, bins):
+        return np.ravel_multi_index(bins.T, self.shape)
+
+    def _gather(self, qbins, offsets, queries):
+        """(query, point) pairs of the bins qbins + offset"""
+        pairs_q, pairs_p = [], []
+        for off in offsets:
+            b = qbins + off
+            inside = np.all((b >= 0) & (b < self.shape), axis=1)
+            q = queries[inside]
+            keys = self._keys(b[inside])
+            start = np.searchsorted(self.keys, keys, side='left')
+            count = np.searchsorted(self.keys, keys, side='right') - start
+            q = np.repeat(q, count)
+            rank = np.arange(q.size) - np.repeat(np.cumsum(count) - count, count)
+            pairs_q.append(q)
+            pairs_p.append(self.order[np.repeat(start, count) + rank])
+        if not pairs_q:
+            return np.zeros((0,), np.int64), np.zeros((0,), np.int64)
+        return np.concatenate(pairs_q), np.concatenate(pairs_p)
+
+    def _ring(self, w):
+        """offsets of the bins at Chebyshev distance w"""
+        dim = self.shape.size
+        rng = range(-w, w + 1)
+        return [np.array(o) for o in itertools.product(rng, repeat=dim)
+                if max(abs(i) for i in o) == w]
+
+    def candidates(self, points, r):
+        """(query, point) pairs of the bins within r of the query points"""
+        w = int(np.ceil(r / self.cell))
+        offsets = [np.array(o) for o in
+                   itertools.product(range(-w, w + 1), repeat=self.shape.size)]
+        return self._gather(self._bins(points), offsets,
+                            np.arange(points.shape[0]))
+
+    def nearest(self, points):
+        """nearest point searched in growing rings of bins"""
+        m = points.shape[0]
+        dist = np.full((m,), np.inf)
+        idx = np.full((m,), -1, dtype=np.int64)
+        if self.keys.size == 0:
+            return dist, idx
+        qbins = self._bins(points)
+        # ring width covering the whole grid from each query bin
+        cover = np.maximum(np.abs(qbins), np.abs(self.shape - 1 - qbins)).max(axis=1)
+        todo = np.arange(m)
+        w = 0
+        while todo.size > 0:
+            if (2 * w + 1) ** self.shape.size > self.keys.size:
+                # rings with more bins than points: compare to all points
+                blocks = -(-todo.size * self.keys.size // (1 << 20))
+                for q in np.array_split(todo, blocks):
+                    d = points[q, None, :] - self.points[None, :, :]
+                    d = np.sqrt(np.sum(d * d, axis=2))
+                    idx[q] = np.argmin(d, axis=1)
+                    dist[q] = d[np.arange(q.size), idx[q]]
+                break
+            q, p = self._gather(qbins[todo], self._ring(w), todo)
+            d = points[q] - self.points[p]
+            d = np.sqrt(np.sum(d * d, axis=1))
+            # best candidate of each query (smallest distance first)
+            order = np.lexsort((d, q))
+            q, p, d = q[order], p[order], d[order]
+            first = np.ones((q.size,), dtype=bool)
+            first[1:] = q[1:] != q[:-1]
+            q, p, d = q[first], p[first], d[first]
+            better = d < dist[q]
+            dist[q[better]] = d[better]
+            idx[q[better]] = p[better]
+            # points out of the searched bins are farther than w bins
+            done = (dist[todo] <= w * self.cell) | (cover[todo] <= w)
+            todo = todo[~done]
+            w += 1
+        return dist, idx
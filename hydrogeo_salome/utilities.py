@@ -30,48 +30,144 @@ NOTE: This file must NOT have dependencies on other files in the macro
 
 # python imports
 import os
+import tempfile
+import weakref
 import numpy as np
 
 # ------------------------------------------------------------------------------
 
 
-def CartGrid(x, y, z=None):
+def CartGrid(x, y, z=None, dtype='uint64', scratch_dir=None, name=None):
     """Build a cartesian grid data (nodes and connections). Returns a tuple with:
-    (ndarray nodes coordinate, ndarray cells connectivities)"""
+    (ndarray nodes coordinate, ndarray cells connectivities)
 
-    if z is None:
-        nodes = np.array([[i, j, 0.] for j in y for i in x])
+    Nodes are numbered with x running fastest, then y and z. Cells are ordered
+    with the last axis running fastest (i, j[, k]) and their connectivities are
+    returned with the integer type given by dtype (uint64, int64, int32...).
 
-        nx = x.size
-        ny = y.size
-        i, j = np.mgrid[0:nx, 0:ny]
-        ij = np.ravel_multi_index(
-            [list(i.ravel()), list(j.ravel())], (nx+1, ny+1), order='F')
+    With a scratch directory (see GetScratchDirectory) both arrays are memory
+    mapped files, filled block by block: <name>_nodes.npy and <name>_cells.npy
+    with a name, unique files otherwise (see scratch_array)."""
 
-        cells = np.array([[i, i+1, i+1+nx+1, i+nx+1]
-                          for i in ij], dtype='uint64')
+    x = np.asarray(x)
+    y = np.asarray(y)
+    dtype = np.dtype(dtype)
 
-    else:
-        nodes = np.array([[i, j, k] for k in z for j in y for i in x])
+    if z is None:
+        nx = x.size - 1
+        ny = y.size - 1
+        _check_index_dtype(x.size * y.size, dtype)
+
+        nodes = scratch_array((x.size * y.size, 3), np.result_type(x, y, 0.),
+                              name and name + '_nodes', scratch_dir,
+                              prefix='cartgrid_nodes')
+        nodes[:, 0] = np.tile(x, y.size)
+        nodes[:, 1] = np.repeat(y, x.size)
+        nodes[:, 2] = 0
+
+        # lower-left node of every cell (i, j)
+        sy = nx + 1
+        base = (np.arange(nx, dtype=dtype)[:, None] +
+                np.arange(ny, dtype=dtype)[None, :] * dtype.type(sy)).ravel()
+        offsets = np.array([0, 1, 1 + sy, sy], dtype=dtype)
+        cells = scratch_array((base.size, 4), dtype, name and name + '_cells',
+                              scratch_dir, prefix='cartgrid_cells')
+        np.add(base[:, None], offsets[None, :], out=cells)
 
+    else:
+        z = np.asarray(z)
         nx = x.size - 1
         ny = y.size - 1
         nz = z.size - 1
-
-        i, j, k = np.mgrid[0:nx, 0:ny, 0:nz]
-        ijk = np.ravel_multi_index(
-            [list(i.ravel()), list(j.ravel()), list(
-                k.ravel())], (nx + 1, ny + 1, nz + 1),
-            order='F')
-        cells = np.array([[i, i+1, i+1+(nx+1), i+(nx+1),
-                           i+(nx+1)*(ny+1), i+1+(nx+1) *
-                           (ny+1), i+1+(nx+1)+(nx+1)*(ny+1),
-                           i+(nx+1)+(nx+1)*(ny+1)]
-                          for i in ijk], dtype='uint64')
+        _check_index_dtype(x.size * y.size * z.size, dtype)
+
+        nodes = scratch_array((x.size * y.size * z.size, 3),
+                              np.result_type(x, y, z), name and name + '_nodes',
+                              scratch_dir, prefix='cartgrid_nodes')
+        n2d = x.size * y.size
+        step = max(1, GetMemoryBudget() // (48 * n2d))
+        for k in range(0, z.size, step):
+            block = nodes[k * n2d:(k + step) * n2d]
+            nk = block.shape[0] // n2d
+            block[:, 0] = np.tile(x, y.size * nk)
+            block[:, 1] = np.tile(np.repeat(y, x.size), nk)
+            block[:, 2] = np.repeat(z[k:k + nk], n2d)
+
+        # lower-left-bottom node of every cell (i, j, k)
+        sy = nx + 1
+        sz = (nx + 1) * (ny + 1)
+        offsets = np.array([0, 1, 1 + sy, sy,
+                            sz, 1 + sz, 1 + sy + sz, sy + sz], dtype=dtype)
+        cells = scratch_array((nx * ny * nz, 8), dtype, name and name + '_cells',
+                              scratch_dir, prefix='cartgrid_cells')
+        jk = (np.arange(ny, dtype=dtype)[:, None] * dtype.type(sy) +
+              np.arange(nz, dtype=dtype)[None, :] * dtype.type(sz)).ravel()
+        step = max(1, GetMemoryBudget() // (80 * max(1, jk.size)))
+        for i in range(0, nx, step):
+            base = (np.arange(i, min(i + step, nx), dtype=dtype)[:, None] +
+                    jk[None, :]).ravel()
+            np.add(base[:, None], offsets[None, :],
+                   out=cells[i * jk.size:i * jk.size + base.size])
 
     return (nodes, cells)
 
 
+# ------------------------------------------------------------------------------
+def _check_index_dtype(n, dtype):
+    """Check if the integer type can address n entities"""
+    if dtype.kind not in 'iu':
+        raise TypeError('connectivities must have an integer type, got {}'.format(dtype))
+    if n > 0 and n - 1 > np.iinfo(dtype).max:
+        raise OverflowError('{} entities can not be indexed with {}'.format(n, dtype))
+
+
+# ------------------------------------------------------------------------------
+def compact_mesh(nodes, cells, cell_mask=None, dtype='int64', scratch_dir=None,
+                 name=None):
+    """
+    Keep the selected cells and only the nodes used by them, renumbered
+    consecutively in the original order (same result of np.unique over the cell
+    nodes, without sorting them). Returns a tuple with:
+    (ndarray compacted nodes, ndarray cells connectivities, ndarray forward map
+    old -> new node id (-1 for removed nodes), ndarray backward map new -> old)
+
+    nodes can be None when the coordinates are not available (lazy grids), the
+    backward map selects them afterwards; cell_mask is a boolean mask or an
+    array of cell ids (None keeps all the cells). With a scratch directory the
+    compacted nodes and cells are memory mapped files (see CartGrid).
+    """
+    cells = np.asarray(cells)
+    if cell_mask is not None:
+        cells = cells[np.asarray(cell_mask)]
+    nnodes = len(nodes) if nodes is not None else (int(cells.max()) + 1 if cells.size else 0)
+
+    # mark used nodes (one pass over the connectivities)
+    used = np.zeros((nnodes,), dtype=bool)
+    used[cells.ravel()] = True
+    backward = np.flatnonzero(used)
+
+    dtype = np.dtype(dtype)
+    _check_index_dtype(backward.size, dtype)
+    forward = np.full((nnodes,), -1, dtype=np.int64 if dtype.kind == 'u' else dtype)
+    forward[backward] = np.arange(backward.size, dtype=forward.dtype)
+
+    # gather by blocks, the outputs may be backed by files
+    step = max(1, GetMemoryBudget() // 128)
+    conn = scratch_array(cells.shape, dtype, name and name + '_cells',
+                         scratch_dir, prefix='compact_cells')
+    for c in range(0, cells.shape[0], step):
+        conn[c:c + step] = forward[cells[c:c + step]]
+    if nodes is not None:
+        nodes = np.asarray(nodes)
+        out = scratch_array((backward.size,) + nodes.shape[1:], nodes.dtype,
+                            name and name + '_nodes', scratch_dir,
+                            prefix='compact_nodes')
+        for c in range(0, backward.size, step):
+            out[c:c + step] = nodes[backward[c:c + step]]
+        nodes = out
+    return (nodes, conn, forward, backward)
+
+
 # ------------------------------------------------------------------------------
 def find_indexes(b):
     """This function is similar to the 'find' a MATLAB function"""
@@ -79,20 +175,108 @@ def find_indexes(b):
 
 
 # ------------------------------------------------------------------------------
-def write_unv(fname, nodes, cells, mat=None):
+def scanline_mask(xc, yc, polygon, max_bytes=None):
+    """
+    Point in polygon test of all the points of a structured set (xc[i], yc[j])
+    by scanlines. For every row yc[j] the crossings of the polygon edges are
+    found once and the points between successive crossings are marked, so the
+    cost is O(ny x edges + nx x ny) instead of testing every point against every
+    edge. Returns a boolean mask (nx, ny), the same of
+    matplotlib.path.Path(polygon).contains_points (same crossing rule, edge
+    from the last vertex to the first included). polygon is an (n, 2) array
+    or a polygons.Polygon (all the rings of its parts and holes, even-odd).
+    """
+    xc = np.asarray(xc, dtype=np.float64)
+    yc = np.asarray(yc, dtype=np.float64)
+    rings = getattr(polygon, 'rings', None)
+    if rings is None:
+        rings = [np.asarray(polygon, dtype=np.float64)]
+    rings = [r for r in rings if r.shape[0] >= 3]
+    nx, ny = xc.size, yc.size
+
+    # points sorted along the rows (crossings split them in intervals)
+    order = np.argsort(xc, kind='stable')
+    xs = xc[order]
+
+    # edges (vtx0 -> vtx1) of every ring
+    mask = np.zeros((nx, ny), dtype=bool)
+    if not rings or nx == 0:
+        return mask
+    x0 = np.concatenate([r[:, 0] for r in rings])
+    y0 = np.concatenate([r[:, 1] for r in rings])
+    x1 = np.concatenate([np.roll(r[:, 0], -1) for r in rings])
+    y1 = np.concatenate([np.roll(r[:, 1], -1) for r in rings])
+    # per row: edge flags and crossings, then the (nx + 1) int64 toggles, their
+    # reversed cumsum and the parity
+    rows = max(1, GetMemoryBudget(max_bytes) // (32 * x0.size + 32 * (nx + 1)))
+    for j0 in range(0, ny, rows):
+        ty = yc[j0:j0 + rows, None]
+        yflag0 = y0[None, :] >= ty
+        yflag1 = y1[None, :] >= ty
+        r, e = np.nonzero(yflag0 != yflag1)
+        ty, yflag1 = ty[r, 0], yflag1[r, e]
+        vx0, vy0, vx1, vy1 = x0[e], y0[e], x1[e], y1[e]
+        lhs = (vy1 - ty) * (vx0 - vx1)
+
+        def crosses(tx):
+            # the +X ray from (tx, ty) hits the edge (matplotlib's rule)
+            return (lhs >= (vx1 - tx) * (vy0 - vy1)) == yflag1
+
+        # the ray crosses the edge for all tx up to the crossing point, locate
+        # it and fix the rounding of the division with the exact predicate
+        with np.errstate(divide='ignore', invalid='ignore'):
+            tcross = vx1 - lhs / (vy0 - vy1)
+        p = np.searchsorted(xs, tcross)
+        while True:
+            back = (p > 0) & ~crosses(xs[np.maximum(p - 1, 0)])
+            ahead = (p < nx) & crosses(xs[np.minimum(p, nx - 1)])
+            if not (back.any() or ahead.any()):
+                break
+            p = p - back + ahead
+
+        # parity of the crossings at the right of every point
+        toggles = np.zeros((yc[j0:j0 + rows].size, nx + 1), dtype=np.int64)
+        np.add.at(toggles, (r, p), 1)
+        inside = np.cumsum(toggles[:, ::-1], axis=1)[:, ::-1][:, 1:] % 2 == 1
+        mask[order, j0:j0 + rows] = inside.T
+    return mask
+
+
+# ------------------------------------------------------------------------------
+def write_unv(fname, nodes, cells, mat=None, offset=0):
     """
     Write the UNV (Universal) file dataset format
     reference in: https://docs.plm.automation.siemens.com/tdoc/nx/12/nx_help#uid:xid1128419:index_advanced:xid1404601:xid1404604
+
+    offset is added to the connectivities (1 for 0-based cells) block by block.
+    """
+
+    # blocks of rows, so memory mapped arrays (see scratch_array) are read
+    # through the page cache and not loaded at once
+    step = max(1, GetMemoryBudget() // 128)
+    node_blocks = ((np.arange(n + 1, min(n + step, nodes.shape[0]) + 1), nodes[n:n + step])
+                   for n in range(0, nodes.shape[0], step))
+    cell_blocks = ((cells[c:c + step] + offset, None if mat is None else mat[c:c + step])
+                   for c in range(0, cells.shape[0], step))
+    write_unv_blocks(fname, node_blocks, cell_blocks)
+
+
+# ------------------------------------------------------------------------------
+def write_unv_blocks(fname, node_blocks, cell_blocks):
+    """
+    Write the UNV (Universal) file dataset format from blocks of data, so the
+    whole mesh does not need to be in memory (see write_unv).
+
+    node_blocks: iterable of tuples (node ids, ndarray nodes coordinate), ids
+    are the (1-based) labels referenced by the connectivities.
+    cell_blocks: iterable of tuples (ndarray cells connectivities, ndarray
+    materials or None), cells are labeled in the order they are given.
     """
 
     # consts
     sep = "    -1"
     si, coordsys, vertices, elements = 164, 2420, 2411, 2412
 
-    # settings
-    if mat is None:
-        mat = np.zeros((cells.shape[0],), dtype=np.int64) + 1
-
     # write unv file
     # print("-- writing file: {}".format(fname))
     with open(fname, "w") as unv:
@@ -121,43 +305,58 @@ def write_unv(fname, nodes, cells, mat=None):
         # write nodes coordinates
         unv.write('{}\n'.format(sep))
         unv.write('{:6g}\n'.format(vertices))  # unv code
-        for n in range(nodes.shape[0]):
-            # node-id, coordinate system label, displ. coord. system, color(11)
-            unv.write('{:10d}{:10d}{:10d}{:10d}\n'.format(n + 1, 1, 1, 11))
-            unv.write('{:25.16E}{:25.16E}{:25.16E}'.format(
-                nodes[n, 0], nodes[n, 1], nodes[n, 2]))
-            unv.write('\n')
+        for ids, nodes in node_blocks:
+            for n in range(nodes.shape[0]):
+                # node-id, coordinate system label, displ. coord. system, color(11)
+                unv.write('{:10d}{:10d}{:10d}{:10d}\n'.format(ids[n], 1, 1, 11))
+                unv.write('{:25.16E}{:25.16E}{:25.16E}'.format(
+                    nodes[n, 0], nodes[n, 1], nodes[n, 2]))
+                unv.write('\n')
         unv.write('{}\n'.format(sep))
 
         # write cells connectivities
         unv.write('{}\n'.format(sep))
         unv.write('{:6g}\n'.format(elements))  # unv code
-        for c in range(cells.shape[0]):
-            # node-id, coordinate system label, displ. coord. system, color(11)
-            unv.write('{:10d}{:10d}{:10d}{:10d}{:10d}{:10d}\n'.format(
-                c + 1, 115, mat[c], mat[c], mat[c], 8))
-            unv.write('{:10d}{:10d}{:10d}{:10d}{:10d}{:10d}{:10d}{:10d}'.format(
-                cells[c, 0], cells[c, 1], cells[c, 2], cells[c, 3],
-                cells[c, 4], cells[c, 5], cells[c, 6], cells[c, 7]))
-            unv.write('\n')
+        label = 0
+        runs = []  # (region, first label, last label) of cells
+        for cells, mat in cell_blocks:
+            if mat is None:
+                mat = np.ones((cells.shape[0],), dtype=np.int64)
+            for c in range(cells.shape[0]):
+                # node-id, coordinate system label, displ. coord. system, color(11)
+                unv.write('{:10d}{:10d}{:10d}{:10d}{:10d}{:10d}\n'.format(
+                    label + c + 1, 115, mat[c], mat[c], mat[c], 8))
+                unv.write('{:10d}{:10d}{:10d}{:10d}{:10d}{:10d}{:10d}{:10d}'.format(
+                    cells[c, 0], cells[c, 1], cells[c, 2], cells[c, 3],
+                    cells[c, 4], cells[c, 5], cells[c, 6], cells[c, 7]))
+                unv.write('\n')
+            # run-length of materials, enough to write the regions at the end
+            if cells.shape[0] > 0:
+                change = np.flatnonzero(np.diff(mat)) + 1
+                first = np.concatenate(([0], change))
+                last = np.concatenate((change, [cells.shape[0]]))
+                runs.extend(zip(mat[first], label + first + 1, label + last))
+            label += cells.shape[0]
         unv.write('{}\n'.format(sep))
 
         # write cells regions
         unv.write('{}\n'.format(sep))
         unv.write('{:6g}\n'.format(2467))  # unv code
-        regions = np.unique(mat)
+        regions = np.unique([r[0] for r in runs])
         for region in regions:
-            ind = find_indexes(mat == region)
+            ranges = [(a, b) for (r, a, b) in runs if r == region]
+            count = sum(b - a + 1 for (a, b) in ranges)
             unv.write('{:10d}{:10d}{:10d}{:10d}{:10d}{:10d}{:10d}{:10d}\n'.format(
-                region, 0, 0, 0, 0, 0, 0, len(ind)))       
+                region, 0, 0, 0, 0, 0, 0, count))
             unv.write('Region_{}\n'.format(region))
             i = 0
-            for c in range(len(ind)):
-                unv.write('{:10d}{:10d}{:10d}{:10d}'.format( 8, ind[c] + 1, 0, 0))
-                i += 1
-                if i == 2:
-                    i = 0
-                    unv.write('\n')
+            for (a, b) in ranges:
+                for c in range(a, b + 1):
+                    unv.write('{:10d}{:10d}{:10d}{:10d}'.format(8, c, 0, 0))
+                    i += 1
+                    if i == 2:
+                        i = 0
+                        unv.write('\n')
             if i == 1:
                 unv.write('\n')
         unv.write('{}\n'.format(sep))
@@ -578,6 +777,197 @@ def volume_hexahedron(nodes):
     return volelm
 
 
+# ------------------------------------------------------------------------------
+def _hexa_shape_derivatives(points):
+    """derivatives (npoints, 3, 8) of the trilinear shape functions at the
+    given points of the reference hexahedron [-1, 1]^3 (corners in CartGrid
+    ordering)"""
+    corners = np.array([[-1, -1, -1], [+1, -1, -1], [+1, +1, -1], [-1, +1, -1],
+                        [-1, -1, +1], [+1, -1, +1], [+1, +1, +1], [-1, +1, +1]],
+                       dtype=np.float64)
+    t = 1.0 + points[:, None, :] * corners[None, :, :]
+    return np.stack((corners[:, 0] * t[:, :, 1] * t[:, :, 2],
+                     corners[:, 1] * t[:, :, 0] * t[:, :, 2],
+                     corners[:, 2] * t[:, :, 0] * t[:, :, 1]), axis=1) / 8.
+
+
+# derivatives at the 8 integration points of volume_hexahedron
+HEXA_GAUSS_POINTS = .577350269189626 * np.array(
+    [[-1, -1, -1], [+1, -1, -1], [+1, +1, -1], [-1, +1, -1],
+     [-1, -1, +1], [+1, -1, +1], [+1, +1, +1], [-1, +1, +1]], dtype=np.float64)
+HEXA_GAUSS_DN = _hexa_shape_derivatives(HEXA_GAUSS_POINTS)
+
+
+def jacobian_determinants(coords, dn, block=4096):
+    """
+    determinants (n, npoints) of the jacobian matrices of hexahedra given by
+    their corners (n, 8, 3) at the points of the shape derivatives dn (see
+    _hexa_shape_derivatives). Cells are processed in blocks small enough to
+    stay in cache: one matrix product gives the jacobians of the whole block
+    and the determinants are expanded in place (same terms of
+    volume_hexahedron).
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    n, npoints = coords.shape[0], dn.shape[0]
+    dn = dn.reshape((-1, 8))
+    det = np.empty((n, npoints))
+    for c in range(0, n, block):
+        x = coords[c:c + block]
+        m = x.shape[0]
+        # a[p, d, k, c]: derivative of the coordinate k along direction d
+        a = np.dot(dn, x.transpose(1, 2, 0).reshape((8, -1)))
+        a = a.reshape((npoints, 3, 3, m))
+        t = a[:, 0, 0] * a[:, 1, 1]
+        t *= a[:, 2, 2]
+        u = a[:, 0, 1] * a[:, 1, 2]
+        u *= a[:, 2, 0]
+        t += u
+        np.multiply(a[:, 1, 0], a[:, 2, 1], out=u)
+        u *= a[:, 0, 2]
+        t += u
+        np.multiply(a[:, 0, 2], a[:, 1, 1], out=u)
+        u *= a[:, 2, 0]
+        t -= u
+        np.multiply(a[:, 0, 1], a[:, 1, 0], out=u)
+        u *= a[:, 2, 2]
+        t -= u
+        np.multiply(a[:, 1, 2], a[:, 2, 1], out=u)
+        u *= a[:, 0, 0]
+        t -= u
+        det[c:c + block] = t.T
+    return det
+
+
+def volume_hexahedra(coords):
+    """
+    Batched volume_hexahedron: coords are the corners (n, 8, 3) of n
+    hexahedra. Returns a tuple with:
+    (ndarray jacobian determinants (n, 8) at the integration points, ndarray
+    volumes (n,))
+    """
+    det = jacobian_determinants(coords, HEXA_GAUSS_DN)
+    # same summation order of the scalar routine (weight = 1)
+    volumes = np.zeros((det.shape[0],))
+    for p in range(det.shape[1]):
+        volumes += det[:, p]
+    return det, volumes
+
+
+# ------------------------------------------------------------------------------
+def GetMemoryBudget(max_bytes=None):
+    """This function returns the memory budget (in bytes) of procedures that
+    work block by block. Unless given, it is read from the environment variable
+    HYDROGEOLOGY_SALOME_MEMORY_BUDGET (in MB, default 512 MB)"""
+    if max_bytes is None:
+        max_bytes = float(os.getenv("HYDROGEOLOGY_SALOME_MEMORY_BUDGET", 512)) * 1024**2
+    return max(int(max_bytes), 1)
+
+
+# ------------------------------------------------------------------------------
+def GetNumWorkers(workers=None):
+    """This function returns the number of processes used by the parallel
+    geometry kernels (see parallel.py). Unless given, it is read from the
+    environment variable HYDROGEOLOGY_SALOME_WORKERS (default 1, serial; 0 for
+    all the cpus)"""
+    if workers is None:
+        workers = int(os.getenv("HYDROGEOLOGY_SALOME_WORKERS", 1))
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return int(workers)
+
+
+# ------------------------------------------------------------------------------
+def GetScratchDirectory(scratch_dir=None):
+    """This function returns the directory where large arrays (nodes coordinate
+    and cells connectivities) are stored as memory mapped files. Unless given,
+    it is read from the environment variable HYDROGEOLOGY_SALOME_SCRATCH_DIR;
+    None (not set) keeps the arrays in memory"""
+    if scratch_dir is None:
+        scratch_dir = os.getenv("HYDROGEOLOGY_SALOME_SCRATCH_DIR") or None
+    if scratch_dir is None:
+        return None
+    scratch_dir = os.path.abspath(scratch_dir)
+    os.makedirs(scratch_dir, exist_ok=True)
+    return scratch_dir
+
+
+# ------------------------------------------------------------------------------
+def GetCacheDirectory(cache_dir=None):
+    """This function returns the directory of the persistent cache (e.g. fitted
+    horizons, see horizons.HorizonCache). Unless given, it is read from the
+    environment variable HYDROGEOLOGY_SALOME_CACHE_DIR (default
+    ~/.cache/hydrogeo_salome)"""
+    if cache_dir is None:
+        cache_dir = os.getenv("HYDROGEOLOGY_SALOME_CACHE_DIR") or os.path.join(
+            os.path.expanduser("~"), ".cache", "hydrogeo_salome")
+    cache_dir = os.path.abspath(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+# ------------------------------------------------------------------------------
+def GetCacheSize(max_bytes=None):
+    """This function returns the size limit (in bytes) of the persistent cache
+    directory. Unless given, it is read from the environment variable
+    HYDROGEOLOGY_SALOME_CACHE_SIZE (in MB, default 256 MB)"""
+    if max_bytes is None:
+        max_bytes = float(os.getenv("HYDROGEOLOGY_SALOME_CACHE_SIZE", 256)) * 1024**2
+    return max(int(max_bytes), 0)
+
+
+# ------------------------------------------------------------------------------
+def scratch_array(shape, dtype, name=None, scratch_dir=None, prefix='scratch'):
+    """
+    Returns an uninitialized array, in memory or, with a scratch directory (see
+    GetScratchDirectory), a memory mapped file. Without a name the file is
+    unique (<scratch_dir>/<prefix>_*.npy), so arrays still mapping former
+    files are never touched, and it is removed once the array is released.
+    With a name the file is <scratch_dir>/<name>.npy, kept to be reopened
+    later with open_scratch_array; an existing file is replaced (it must not
+    be mapped anymore on Windows).
+    """
+    scratch_dir = GetScratchDirectory(scratch_dir)
+    if scratch_dir is None or np.prod(shape) == 0:
+        return np.empty(shape, dtype=dtype)
+    if name is None:
+        fd, fname = tempfile.mkstemp(suffix='.npy', prefix=prefix + '_',
+                                     dir=scratch_dir)
+        os.close(fd)
+    else:
+        fname = os.path.join(scratch_dir, name + '.npy')
+        if os.path.exists(fname):
+            os.remove(fname)
+    array = np.lib.format.open_memmap(fname, mode='w+', dtype=dtype, shape=shape)
+    if name is None:
+        weakref.finalize(array, _remove_scratch_file, fname)
+    return array
+
+
+def _remove_scratch_file(fname):
+    try:
+        os.remove(fname)
+    except OSError:
+        pass
+
+
+# ------------------------------------------------------------------------------
+def open_scratch_array(name, scratch_dir=None, mode='r'):
+    """Reopen (memory mapped) an array stored by scratch_array under name"""
+    scratch_dir = GetScratchDirectory(scratch_dir)
+    if scratch_dir is None:
+        raise ValueError('no scratch directory given (see GetScratchDirectory)')
+    return np.load(os.path.join(scratch_dir, name + '.npy'), mmap_mode=mode)
+
+
+# ------------------------------------------------------------------------------
+def open_scratch_mesh(name, scratch_dir=None, mode='r'):
+    """Reopen the nodes coordinate and cells connectivities stored under name,
+    e.g. by CartGrid or compact_mesh. Returns a tuple with:
+    (ndarray nodes coordinate, ndarray cells connectivities)"""
+    return (open_scratch_array(name + '_nodes', scratch_dir, mode),
+            open_scratch_array(name + '_cells', scratch_dir, mode))
+
+
 # ------------------------------------------------------------------------------
 def GetModulePath():
     """This function returns the absolute path to the module"""
@@ -28,8 +28,8 @@
 # This file is a TUI example to generated automatically a real geology
 # model from horizons using SALOME python functionality
 #
-# Note: This TUI can be extended to add several other layers separately 
-# and then merge them to build a unique model.
+# Note: This TUI can be extended to add several other layers separately
+# and then merge them to build a unique model (see tui_stratigraphic_model.py).
 # ======================================================================
 
 
@@ -37,11 +37,11 @@
 
 import numpy as np
 import shapefile # pyshp
-from matplotlib import path
 import matplotlib.pyplot as plt
-import scipy.interpolate as inter
 import hydrogeo_salome as hgs
+from hydrogeo_salome import horizons
 from hydrogeo_salome import utilities as utils
+from hydrogeo_salome.grids import StructuredGrid
 
 # Open shapefile
 sf = shapefile.Reader("C:\DFiles\Projects\SalomePluginsDev\HydrogeologySalome\data\TikunaAquifer.shp")
@@ -65,23 +65,16 @@ x = np.linspace(shp.bbox[0], shp.bbox[2], int(
 y = np.linspace(shp.bbox[1], shp.bbox[3], int(
     np.floor((shp.bbox[3]-shp.bbox[1])/dy)))
 z = np.linspace(0, 1, nz+1)
-(nodes, cells) = utils.CartGrid(x, y, z)
+grid = StructuredGrid(x, y, z)
+(nodes, cells) = grid.to_arrays()
 
-cell_center = np.zeros((cells.shape[0], 3))
-for c in range(cells.shape[0]):
-    cell_center[c, :] = np.mean(nodes[cells[c, :], :], axis=0)
+cell_center = grid.cell_centroids()
 
 utils.write_unv('gridbase.unv', nodes, cells + 1)
 
 
-p = path.Path(pts)
-msk = p.contains_points(cell_center[:, [0, 1]])
-cnodes = cells[msk]
-vnodes = np.unique(cnodes.reshape(cnodes.size))
-idx = np.zeros((int(vnodes.max()+1),))
-idx[vnodes] = np.arange(0, vnodes.size)
-vert = nodes[vnodes]
-hexa = np.reshape(idx[cnodes].ravel(), (cnodes.shape[0], 8))
+grid.clip_columns(pts)
+(vert, hexa, _, _) = utils.compact_mesh(nodes, cells, grid.active_cells())
 
 ## used out of salome interface
 # # plot nodes
@@ -89,34 +82,20 @@ hexa = np.reshape(idx[cnodes].ravel(), (cnodes.shape[0], 8))
 # ax = fig.add_subplot(111, projection='3d')
 # ax.plot3D(vert[:, 0], vert[:, 1], vert[:, 2], 'r.')
 
-utils.write_unv('cube-1.unv', vert, np.int64(hexa) + 1)
-
-# top horizon
-top = vert[:, -1] == 1
-D = np.loadtxt('"C:\DFiles\Projects\SalomePluginsDev\HydrogeologySalome\data\Tikuna_top_horizon.txt', 
-               skiprows=1, usecols=[1, 2, 3])
-xt = D[:, 0]
-xx = [np.min(x), np.max(x)]
-yt = D[:, 1]
-yy = [np.min(y), np.max(y)]
-zt = D[:, 2]
-
-# base horizon
-base = vert[:, -1] == 0
-D = np.loadtxt('"C:\DFiles\Projects\SalomePluginsDev\HydrogeologySalome\data\Tikuna_base_horizon.txt', 
-               skiprows=1, usecols=[1, 2, 3])
-xb = D[:, 0]
-xx = [np.min(x), np.max(x)]
-yb = D[:, 1]
-yy = [np.min(y), np.max(y)]
-zb = D[:, 2]
-
-# interpolate function
-top_fun = inter.Rbf(xt, yt, zt, function='linear', smooth=100)
-base_fun = inter.Rbf(xb, yb, zb, function='linear', smooth=100
+utils.write_unv('cube-1.unv', vert, hexa + 1)
+
+# horizons (local RBF, see horizons.METHODS for the other backends), the
+# picks are streamed and averaged on bins of half the grid cells before the fit
+bin_size = (0.5 * dx, 0.5 * dy)
+top_fun = horizons.load_horizon("C:\DFiles\Projects\SalomePluginsDev\HydrogeologySalome\data\Tikuna_top_horizon.txt",
+                                method='local', function='linear', smooth=100,
+                                bin_size=bin_size)
+base_fun = horizons.load_horizon("C:\DFiles\Projects\SalomePluginsDev\HydrogeologySalome\data\Tikuna_base_horizon.txt",
+                                 method='local', function='linear', smooth=100,
+                                 bin_size=bin_size)
 
 # create aquifer model
-mesh = hgs.macros.CreateMeshFromTopBase(vert, hexa, top, base)
+mesh = hgs.macros.CreateMeshFromTopBase(vert, hexa, top_fun, base_fun)
 
 # export grid
 utils.write_coords_lnods('aquifer.unv', mesh)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+# Copyright (c) 2017-2021 JCT
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Main authors: JCT ~ Jonathan Teixeira (https://github.com/jontateixeira)
+#
+
+# ======================================================================
+# This file is a TUI example to generate a multi-unit (stratigraphic)
+# geology model from several horizons using SALOME python functionality
+#
+# Note: horizons are listed from the base to the top of the model, the
+# intermediate one here is only a sample surface between Tikuna horizons.
+# ======================================================================
+
+from hydrogeo_salome import horizons
+from hydrogeo_salome import macros
+from hydrogeo_salome import polygons
+
+# model limits (all the shapes, parts and holes)
+limits = polygons.read_shapefile("C:\DFiles\Projects\SalomePluginsDev\HydrogeologySalome\data\TikunaAquifer.shp")
+
+# horizons (local RBF, see horizons.METHODS for the other backends), the
+# picks are averaged on bins of half the model cells before the fit
+bin_size = 0.5 * (limits.bbox[2:] - limits.bbox[:2]) / 100
+base_fun = horizons.load_horizon("C:\DFiles\Projects\SalomePluginsDev\HydrogeologySalome\data\Tikuna_base_horizon.txt",
+                                 method='local', function='linear', smooth=100,
+                                 bin_size=bin_size)
+top_fun = horizons.load_horizon("C:\DFiles\Projects\SalomePluginsDev\HydrogeologySalome\data\Tikuna_top_horizon.txt",
+                                method='local', function='linear', smooth=100,
+                                bin_size=bin_size)
+middle_fun = lambda x, y: 0.5 * (base_fun(x, y) + top_fun(x, y))
+
+# two units: 2 layers in the lower one and 4 in the upper one
+grid, mat = macros.CreateStratigraphicModel('aquifer_units.unv', limits, 100, 100,
+                                            [base_fun, middle_fun, top_fun],
+                                            [2, 4], min_thickness=1.0)
+
+# load it in SALOME (one group per unit)
+mesh = macros.LoadSMesh('aquifer_units.unv')